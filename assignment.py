@@ -0,0 +1,91 @@
+# Importing the necessary Python libraries
+import numpy as np
+
+#scipy has a fast C implementation of the hungarian algorithm. without it we use the plain python one below.
+try:
+     from scipy.optimize import linear_sum_assignment
+except ImportError:
+     linear_sum_assignment = None
+
+
+#hungarian algorithm (shortest augmenting path version) for a cost matrix with rows <= columns.
+#returns the column picked for every row so that the total cost is as small as possible.
+def _hungarian(cost):
+     rows, columns = cost.shape
+     u = np.zeros(rows + 1)
+     v = np.zeros(columns + 1)
+     match = np.zeros(columns + 1, dtype=int)  #row (1-based) matched to every column, 0 = free
+     way = np.zeros(columns + 1, dtype=int)
+     for row in range(1, rows + 1):
+          match[0] = row
+          column = 0
+          min_value = np.full(columns + 1, np.inf)
+          used = np.zeros(columns + 1, dtype=bool)
+          while True:
+               used[column] = True
+               current_row = match[column]
+               free = ~used[1:]
+               reduced = cost[current_row - 1] - u[current_row] - v[1:]
+               better = free & (reduced < min_value[1:])
+               min_value[1:][better] = reduced[better]
+               way[1:][better] = column
+               candidates = np.where(free, min_value[1:], np.inf)
+               next_column = int(np.argmin(candidates)) + 1
+               delta = candidates[next_column - 1]
+               u[match[used]] += delta
+               v[used] -= delta
+               min_value[1:][free] -= delta
+               column = next_column
+               if match[column] == 0:
+                    break
+          while column:
+               previous = way[column]
+               match[column] = match[previous]
+               column = previous
+
+     picked = np.full(rows, -1, dtype=int)
+     for column in range(1, columns + 1):
+          if match[column]:
+               picked[match[column] - 1] = column - 1
+     return picked
+
+
+#takes a (storyline points x candidate slides) score matrix, higher is better, and gives every point a slide.
+#slides are kept distinct wherever there are enough of them. points left over (more points than slides) get their best slide.
+#method is "hungarian" for the best total score or "greedy" for the quick best-pair-first version.
+def assign_slides(scores, method="hungarian"):
+     scores = np.asarray(scores, dtype=float)
+     points, slides = scores.shape
+     if points == 0 or slides == 0:
+          return [None] * points
+
+     if method == "greedy":
+          picked = np.full(points, -1, dtype=int)
+          taken = set()
+          for flat in np.argsort(-scores, axis=None, kind="stable"):
+               point, slide = divmod(int(flat), slides)
+               if picked[point] == -1 and slide not in taken:
+                    picked[point] = slide
+                    taken.add(slide)
+                    if len(taken) == min(points, slides):
+                         break
+     else:
+          cost = scores.max() - scores
+          transposed = points > slides
+          if transposed:
+               cost = cost.T
+          if linear_sum_assignment is not None:
+               row_ids, column_ids = linear_sum_assignment(cost)
+               matched = np.full(cost.shape[0], -1, dtype=int)
+               matched[row_ids] = column_ids
+          else:
+               matched = _hungarian(cost)
+          if transposed:
+               picked = np.full(points, -1, dtype=int)
+               for slide, point in enumerate(matched):
+                    picked[point] = slide
+          else:
+               picked = matched
+
+     best = scores.argmax(axis=1)
+     return [int(slide) if slide != -1 else int(best[point]) for point, slide in enumerate(picked)]
@@ -0,0 +1,227 @@
+# Importing the necessary Python libraries
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+#a local stand-in for the openai API, so the app can be measured without spending money or hitting real rate limits.
+#it speaks just enough of /v1/chat/completions and /v1/embeddings for the openai client, and can be told to be slow,
+#rate limited or flaky. point the client at it with openai.base_url = server.url (or OPENAI_BASE_URL).
+#
+#   python -m benchmarks.fake_openai --port 8765 --latency 0.4 --rpm 3500 --error-rate 0.01
+
+
+#rough token count (~4 characters per token), good enough for usage numbers and latency modelling.
+def estimate_tokens(text):
+     return max(1, len(text) // 4)
+
+
+## ANSWERS
+# ---------------------------------------------------------------------------------------------------------------------
+
+#picks an answer that looks like what the real model would give for each of the prompts in the app.
+def fake_answer(system_prompt, user_prompt, json_mode):
+     seed = int(hashlib.md5(user_prompt.encode("utf-8")).hexdigest(), 16)
+
+     if json_mode and "slides that you would include" in system_prompt:
+          number = re.search(r"json map of (\d+) slides", system_prompt)
+          number = int(number.group(1)) if number else 5
+          return json.dumps({f"Slide {nr}": f"Storypoint {nr} about {user_prompt[:40]}" for nr in range(1, number + 1)})
+
+     slide_ids = list(dict.fromkeys(re.findall(r"^(s\d+):", system_prompt, flags=re.MULTILINE)))
+     if json_mode:
+          points = re.findall(r"^(\d+) ", user_prompt, flags=re.MULTILINE) or ["1"]
+          answer = {}
+          for point in points:
+               rng = random.Random(seed + int(point))
+               picked = rng.sample(slide_ids, min(3, len(slide_ids)))
+               answer[point] = {slide_id: rng.randint(1, 10) for slide_id in picked}
+          return json.dumps(answer)
+
+     if "html" in system_prompt.lower():
+          return ("<html><head><style>.slide{width:640px;height:360px;background:linear-gradient(#4b6cb7,#182848);color:#fff}</style></head>"
+                  f"<body><div class='slide'><h1>{user_prompt[:60]}</h1><ul><li>One</li><li>Two</li><li>Three</li></ul></div></body></html>")
+
+     if slide_ids:
+          return slide_ids[seed % len(slide_ids)]
+     names = re.findall(r"deck_\d{3,}_slide_\d{4,}", system_prompt)
+     return names[seed % len(names)] if names else "deck_000_slide_0000"
+
+
+## SERVER
+# ---------------------------------------------------------------------------------------------------------------------
+
+class FakeOpenAIServer:
+     def __init__(self, host="127.0.0.1", port=0, latency=0.3, latency_per_1k_tokens=0.05, jitter=0.1,
+                  rpm=None, error_rate=0.0, seed=0, token_latency=0.0):
+          self.latency = latency                              #seconds every call takes at least
+          self.latency_per_1k_tokens = latency_per_1k_tokens  #extra seconds per 1000 prompt tokens, big prompts are slow
+          self.token_latency = token_latency                  #seconds per generated token, long answers are slow
+          self.jitter = jitter                                #random extra latency, as a fraction of the latency
+          self.rpm = rpm                                      #requests per minute before answering 429, None for no limit
+          self.error_rate = error_rate                        #share of calls that fail with a 500
+          self.random = random.Random(seed)
+          self.lock = threading.Lock()
+          self.allowance = float(rpm or 0)
+          self.last_check = time.monotonic()
+          self.reset_counters()
+
+          server = self
+
+          class Handler(BaseHTTPRequestHandler):
+               protocol_version = "HTTP/1.1"
+
+               def log_message(self, *args):
+                    pass
+
+               def do_POST(self):
+                    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                    status, payload, headers = server.handle(self.path, json.loads(body or b"{}"))
+                    if not isinstance(payload, dict):
+                         self.send_stream(payload)
+                         return
+                    data = json.dumps(payload).encode("utf-8")
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    for key, value in headers.items():
+                         self.send_header(key, value)
+                    self.end_headers()
+                    self.wfile.write(data)
+
+               #server-sent events like the real API with stream=True, the connection closes after [DONE].
+               def send_stream(self, chunks):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    self.close_connection = True
+                    #a client that stops reading half way (the user moved on) just closes the connection.
+                    try:
+                         for chunk in chunks:
+                              self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                              self.wfile.flush()
+                         self.wfile.write(b"data: [DONE]\n\n")
+                         self.wfile.flush()
+                    except (BrokenPipeError, ConnectionResetError):
+                         pass
+
+          self.httpd = ThreadingHTTPServer((host, port), Handler)
+          self.httpd.daemon_threads = True
+          self.url = f"http://{host}:{self.httpd.server_address[1]}/v1/"
+          self.thread = None
+
+     def reset_counters(self):
+          with self.lock:
+               self.counters = {"requests": 0, "rate_limited": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+     def start(self):
+          self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+          self.thread.start()
+          return self
+
+     def stop(self):
+          self.httpd.shutdown()
+          self.httpd.server_close()
+
+     #token bucket refilled at rpm per minute.
+     def _allowed(self):
+          if not self.rpm:
+               return True
+          now = time.monotonic()
+          self.allowance = min(self.rpm, self.allowance + (now - self.last_check) * self.rpm / 60)
+          self.last_check = now
+          if self.allowance < 1:
+               return False
+          self.allowance -= 1
+          return True
+
+     def handle(self, path, request):
+          with self.lock:
+               self.counters["requests"] += 1
+               allowed = self._allowed()
+               failed = self.random.random() < self.error_rate
+               jitter = self.random.random() * self.jitter
+               if not allowed:
+                    self.counters["rate_limited"] += 1
+               elif failed:
+                    self.counters["errors"] += 1
+
+          if not allowed:
+               return 429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}, {"retry-after": "1"}
+          if failed:
+               time.sleep(self.latency * (1 + jitter))
+               return 500, {"error": {"message": "The server had an error", "type": "server_error"}}, {}
+
+          if path.endswith("/embeddings"):
+               return self._embeddings(request)
+          return self._chat(request, jitter)
+
+     def _chat(self, request, jitter):
+          messages = request.get("messages", [])
+          system_prompt = next((m["content"] for m in messages if m["role"] == "system"), "")
+          user_prompt = next((m["content"] for m in messages if m["role"] == "user"), "")
+          json_mode = (request.get("response_format") or {}).get("type") == "json_object"
+          prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+
+          time.sleep((self.latency + prompt_tokens / 1000 * self.latency_per_1k_tokens) * (1 + jitter))
+          answer = fake_answer(system_prompt, user_prompt, json_mode)
+          completion_tokens = estimate_tokens(answer)
+          with self.lock:
+               self.counters["prompt_tokens"] += prompt_tokens
+               self.counters["completion_tokens"] += completion_tokens
+          if request.get("stream"):
+               return 200, self._chunks(request, answer), {}
+          time.sleep(completion_tokens * self.token_latency)
+          return 200, {"id": f"chatcmpl-{self.counters['requests']}",
+                       "object": "chat.completion",
+                       "created": int(time.time()),
+                       "model": request.get("model", "gpt-3.5-turbo-1106"),
+                       "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                       "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                 "total_tokens": prompt_tokens + completion_tokens}}, {}
+
+     #the answer a few characters (about one token) at a time, at token_latency per token.
+     def _chunks(self, request, answer):
+          chunk_id = f"chatcmpl-{self.counters['requests']}"
+          base = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                  "model": request.get("model", "gpt-3.5-turbo-1106")}
+          yield dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+          for start in range(0, len(answer), 4):
+               time.sleep(self.token_latency)
+               yield dict(base, choices=[{"index": 0, "delta": {"content": answer[start:start + 4]}, "finish_reason": None}])
+          yield dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+
+     def _embeddings(self, request):
+          texts = request.get("input", [])
+          texts = [texts] if isinstance(texts, str) else texts
+          time.sleep(self.latency)
+          data = []
+          for nr, text in enumerate(texts):
+               rng = random.Random(hashlib.md5(str(text).encode("utf-8")).hexdigest())
+               data.append({"object": "embedding", "index": nr, "embedding": [rng.uniform(-1, 1) for _ in range(256)]})
+          tokens = sum(estimate_tokens(str(text)) for text in texts)
+          with self.lock:
+               self.counters["prompt_tokens"] += tokens
+          return 200, {"object": "list", "data": data, "model": request.get("model"),
+                       "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}, {}
+
+
+if __name__ == "__main__":
+     parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI API.")
+     parser.add_argument("--host", default="127.0.0.1")
+     parser.add_argument("--port", type=int, default=8765)
+     parser.add_argument("--latency", type=float, default=0.3)
+     parser.add_argument("--latency-per-1k-tokens", type=float, default=0.05)
+     parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per generated token")
+     parser.add_argument("--rpm", type=int, default=None)
+     parser.add_argument("--error-rate", type=float, default=0.0)
+     args = parser.parse_args()
+     server = FakeOpenAIServer(args.host, args.port, args.latency, args.latency_per_1k_tokens, rpm=args.rpm, error_rate=args.error_rate,
+                             token_latency=args.token_latency)
+     print(f"Fake OpenAI API on {server.url}")
+     server.httpd.serve_forever()
@@ -0,0 +1,189 @@
+# Importing the necessary Python libraries
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.startup import check_startup
+from benchmarks.synthetic_graph import FakeGraph, synthetic_context, synthetic_storyline
+
+#load and latency benchmarks for the slide pipeline, with the fake openai server and a synthetic graph instead of the real services.
+#run it from the repository root before every deploy and compare the numbers:
+#
+#   python -m benchmarks.run_benchmarks --sizes 1000,10000,100000 --concurrency 1,4,16 --requests 40 --output bench.json
+#
+#for every library size and concurrency level it reports p50/p95/p99 latency, throughput, prompt tokens per call and memory
+#for respond() (per matcher), process_list_AI(), process_list_batch(), slide_deck_storyline() and html_AI(),
+#plus html_first_chunk: how long until the first piece of a streamed html slide is there (what the user waits before seeing anything).
+#it starts with the startup budget check from startup.py (the import time of each entry point).
+
+try:
+     import resource
+except ImportError:
+     resource = None
+
+
+def percentile(values, p):
+     if not values:
+          return None
+     values = sorted(values)
+     position = (len(values) - 1) * p / 100
+     lower = int(position)
+     upper = min(lower + 1, len(values) - 1)
+     return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+#peak resident memory of this process in MB (not available on windows).
+def peak_rss_mb():
+     if resource is None:
+          return None
+     peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+     return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+#a respond() that finds no slide counts as an error, not as a fast answer.
+def found(png_path):
+     if png_path is None:
+          raise ValueError("no slide found")
+     return png_path
+
+#runs func on every job with `concurrency` threads and collects the numbers for one row of the report.
+def measure(name, func, jobs, concurrency, server, size=None, trace_memory=False):
+     server.reset_counters()
+     if trace_memory:
+          tracemalloc.start()
+     latencies, errors = [], 0
+
+     def timed(job):
+          start = time.perf_counter()
+          try:
+               func(job)
+               return time.perf_counter() - start, None
+          except Exception as error:
+               return time.perf_counter() - start, error
+
+     start = time.perf_counter()
+     with ThreadPoolExecutor(max_workers=concurrency) as pool:
+          for latency, error in pool.map(timed, jobs):
+               latencies.append(latency)
+               errors += error is not None
+     wall = time.perf_counter() - start
+
+     memory_mb = None
+     if trace_memory:
+          memory_mb = round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+          tracemalloc.stop()
+     counters = dict(server.counters)
+     return {"benchmark": name, "size": size, "concurrency": concurrency, "calls": len(jobs), "errors": errors,
+             "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+             "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+             "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+             "throughput_per_s": round(len(jobs) / wall, 2) if wall else None,
+             "llm_requests": counters["requests"],
+             "rate_limited": counters["rate_limited"],
+             "prompt_tokens_per_call": round(counters["prompt_tokens"] / len(jobs), 1) if jobs else 0,
+             "traced_peak_mb": memory_mb,
+             "peak_rss_mb": peak_rss_mb()}
+
+
+def print_table(results):
+     columns = ["benchmark", "size", "concurrency", "calls", "errors", "p50_ms", "p95_ms", "p99_ms",
+                "throughput_per_s", "prompt_tokens_per_call", "peak_rss_mb"]
+     widths = {column: max(len(column), *(len(str(row.get(column))) for row in results)) for column in columns}
+     print("  ".join(column.ljust(widths[column]) for column in columns))
+     for row in results:
+          print("  ".join(str(row.get(column)).ljust(widths[column]) for column in columns))
+
+
+def main():
+     parser = argparse.ArgumentParser(description="Benchmark the slide pipeline against local stand-ins for OpenAI and Neo4j.")
+     parser.add_argument("--sizes", default="1000,10000,100000", help="library sizes in storypoints, comma separated")
+     parser.add_argument("--concurrency", default="1,4,16", help="concurrency levels, comma separated")
+     parser.add_argument("--requests", type=int, default=40, help="calls per benchmark and concurrency level")
+     parser.add_argument("--storyline-length", type=int, default=10)
+     parser.add_argument("--matchers", default="llm,index,bm25", help="respond() matchers to benchmark (llm, index, bm25, sharded)")
+     parser.add_argument("--latency", type=float, default=0.3, help="fake openai base latency in seconds")
+     parser.add_argument("--latency-per-1k-tokens", type=float, default=0.05)
+     parser.add_argument("--token-latency", type=float, default=0.005, help="fake openai seconds per generated token")
+     parser.add_argument("--rpm", type=int, default=None, help="fake openai rate limit in requests per minute")
+     parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake openai calls that fail")
+     parser.add_argument("--trace-memory", action="store_true", help="measure peak python allocations per benchmark (slower)")
+     parser.add_argument("--output", help="write the results as json to this file")
+     parser.add_argument("--skip-startup", action="store_true", help="don't run the startup budget check")
+     args = parser.parse_args()
+
+     results = []
+     if not args.skip_startup:
+          for result in check_startup():
+               results.append(result)
+               print(f"{result['benchmark']}: {result['p50_ms']} ms import (budget {result['budget_ms']} ms) " + ("ok" if not result["errors"] else "; ".join(result["problems"])))
+
+     server = FakeOpenAIServer(latency=args.latency, latency_per_1k_tokens=args.latency_per_1k_tokens,
+                               rpm=args.rpm, error_rate=args.error_rate, token_latency=args.token_latency).start()
+     work_dir = tempfile.mkdtemp(prefix="slide_bench_")
+     #everything the app writes goes to a scratch folder, and the openai client talks to the fake server.
+     os.environ.update({"OPENAI_API_KEY": "benchmark", "OPENAI_BASE_URL": server.url,
+                        "LLM_CACHE_PATH": os.path.join(work_dir, "llm_cache.sqlite"),
+                        "SLIDE_INDEX_PATH": os.path.join(work_dir, "slide_index"),
+                        "CONTEXT_SNAPSHOT_PATH": os.path.join(work_dir, "context_snapshot.json")})
+
+     import openai
+     from slide_pipeline import SlidePipeline
+     from graph_context import ContextProvider
+     openai.base_url = server.url
+     openai.api_key = "benchmark"
+     #the same pipeline the apps use, only with the synthetic context swapped in for every library size.
+     pipeline = SlidePipeline.from_env()
+
+     sizes = [int(size) for size in args.sizes.split(",")]
+     levels = [int(level) for level in args.concurrency.split(",")]
+     matchers = [matcher for matcher in args.matchers.split(",") if matcher]
+
+     def run(name, func, jobs, concurrency, size=None):
+          pipeline.cache.clear()
+          result = measure(name, func, jobs, concurrency, server, size, args.trace_memory)
+          results.append(result)
+          print(f"{name} size={size} concurrency={concurrency}: p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+                f"{result['throughput_per_s']}/s, {result['prompt_tokens_per_call']} prompt tokens/call, {result['errors']} errors")
+
+     for size in sizes:
+          rows = synthetic_context(size)
+          graph = FakeGraph(rows)
+          provider = ContextProvider(lambda: graph, snapshot_path=os.path.join(work_dir, f"context_{size}.json"))
+          pipeline.watch_context(provider)
+          start = time.perf_counter()
+          provider.rows()
+          results.append({"benchmark": "context_load_and_index", "size": size, "concurrency": 1, "calls": 1, "errors": 0,
+                          "p50_ms": round((time.perf_counter() - start) * 1000, 2), "peak_rss_mb": peak_rss_mb()})
+
+          queries = [f"{point} ({nr})" for nr, point in enumerate(synthetic_storyline(args.requests, seed=size))]
+          storylines = [synthetic_storyline(args.storyline_length, seed=size + nr) for nr in range(max(1, args.requests // args.storyline_length))]
+          for concurrency in levels:
+               for matcher in matchers:
+                    run(f"respond[{matcher}]", lambda query: found(pipeline.respond(query, context=provider, matcher=matcher)), queries, concurrency, size)
+               run("process_list_AI", lambda storyline: pipeline.process_list_AI([storyline], context=provider), storylines, concurrency, size)
+               run("process_list_batch", lambda storyline: pipeline.process_list_batch([storyline], context=provider), storylines, concurrency, size)
+          provider.stop()
+
+     #these two don't depend on the size of the library.
+     topics = [f"Topic {nr}: {point}" for nr, point in enumerate(synthetic_storyline(args.requests, seed=1))]
+     storylines = [synthetic_storyline(args.storyline_length, seed=nr) for nr in range(max(1, args.requests // args.storyline_length))]
+     for concurrency in levels:
+          run("slide_deck_storyline", lambda topic: pipeline.slide_deck_storyline(topic, 10), topics, concurrency)
+          run("html_AI", lambda storyline: pipeline.html_AI([storyline]), storylines, concurrency)
+          run("html_first_chunk", lambda topic: next(pipeline.html_maker_stream(topic)), topics, concurrency)
+
+     server.stop()
+     print()
+     print_table(results)
+     if args.output:
+          with open(args.output, "w", encoding="utf-8") as file:
+               json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+     main()
@@ -0,0 +1,97 @@
+# Importing the necessary Python libraries
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+#startup budget check: imports each entry point in a fresh interpreter with python -X importtime and fails when it takes
+#longer than its budget, or when it pulls in a package that should only load on first use (openai, langchain, scipy...).
+#run it from the repository root:
+#
+#   python -m benchmarks.startup
+#   python -m benchmarks.startup --budget slide_pipeline=200 --runs 5
+#
+#the budgets are milliseconds of import time (the best of --runs), measured on a developer laptop. the UI budget is mostly gradio.
+
+BUDGETS_MS = {"slide_pipeline": 300, "cli": 300, "main": 8000}
+
+#packages that must not be imported just by starting up. they load with the first request or in warm_up().
+#(Pillow isn't on the list, gradio imports it anyway.)
+DEFERRED = ("openai", "langchain", "langchain_community", "scipy", "tiktoken", "neo4j")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+#runs `import module` in a new interpreter. returns the import time in ms, the wall time in ms (interpreter start included),
+#every imported module with its cumulative time in ms, and the error output if the import failed.
+def measure_import(module, env=None):
+     started = time.perf_counter()
+     result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, env=env)
+     wall_ms = (time.perf_counter() - started) * 1000
+     modules = {}
+     for line in result.stderr.splitlines():
+          match = IMPORTTIME_LINE.match(line)
+          if match:
+               modules[match.group(4)] = int(match.group(2)) / 1000
+     error = result.stderr.strip().splitlines()[-1] if result.returncode != 0 else None
+     return modules.get(module), wall_ms, modules, error
+
+#everything the entry points write at import time goes to a scratch folder.
+def scratch_env():
+     work_dir = tempfile.mkdtemp(prefix="slide_startup_")
+     env = dict(os.environ)
+     env.update({"LLM_CACHE_PATH": os.path.join(work_dir, "llm_cache.sqlite"),
+                 "SLIDE_INDEX_PATH": os.path.join(work_dir, "slide_index"),
+                 "CONTEXT_SNAPSHOT_PATH": os.path.join(work_dir, "context_snapshot.json"),
+                 "SLIDE_ASSET_CACHE": os.path.join(work_dir, "assets")})
+     return env
+
+#one result row per module, in the format of run_benchmarks.py. errors is 1 when the budget or the deferred imports are broken.
+def check_startup(budgets=BUDGETS_MS, runs=3, top=5):
+     env = scratch_env()
+     results = []
+     for module, budget in budgets.items():
+          best, wall, modules, error = None, None, {}, None
+          for _ in range(runs):
+               import_ms, wall_ms, imported, error = measure_import(module, env)
+               if error is not None:
+                    break
+               if best is None or import_ms < best:
+                    best, wall, modules = import_ms, wall_ms, imported
+          loaded = sorted(name for name in modules if name in DEFERRED)
+          slowest = sorted(((ms, name) for name, ms in modules.items() if name not in (module, "site") and "." not in name), reverse=True)[:top]
+          problems = []
+          if error is not None:
+               problems.append(f"import failed: {error}")
+          elif best > budget:
+               problems.append(f"{best:.0f} ms is over the budget of {budget} ms")
+          if loaded:
+               problems.append("loads " + ", ".join(loaded) + " at startup")
+          results.append({"benchmark": f"startup[{module}]", "size": None, "concurrency": 1, "calls": runs, "errors": int(bool(problems)),
+                          "p50_ms": round(best, 1) if best is not None else None, "wall_ms": round(wall, 1) if wall is not None else None,
+                          "budget_ms": budget, "problems": problems,
+                          "slowest_imports": [f"{name} {ms:.0f} ms" for ms, name in slowest]})
+     return results
+
+
+def main():
+     parser = argparse.ArgumentParser(description="Check the import time of the entry points against a budget.")
+     parser.add_argument("--budget", action="append", default=[], help="module=milliseconds, replaces the default budgets")
+     parser.add_argument("--runs", type=int, default=3, help="imports per module, the fastest one counts")
+     args = parser.parse_args()
+
+     budgets = {module: float(ms) for module, ms in (budget.split("=") for budget in args.budget)} or BUDGETS_MS
+     results = check_startup(budgets, args.runs)
+     for result in results:
+          status = "ok" if not result["errors"] else "FAILED: " + "; ".join(result["problems"])
+          print(f"{result['benchmark']}: {result['p50_ms']} ms import, {result['wall_ms']} ms with interpreter start "
+                f"(budget {result['budget_ms']} ms) {status}")
+          print("    slowest: " + ", ".join(result["slowest_imports"]))
+     sys.exit(1 if any(result["errors"] for result in results) else 0)
+
+
+if __name__ == "__main__":
+     main()
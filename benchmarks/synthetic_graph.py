@@ -0,0 +1,66 @@
+# Importing the necessary Python libraries
+import random
+
+#synthetic slide libraries of any size, shaped like the real knowledge graph:
+#decks of slides, one topic per slide, one to three short abstract storypoints per topic, with lots of repeated storypoints.
+
+SUBJECTS = ["Growth", "Competition", "Market", "Revenue", "Risk", "Team", "Customer", "Product", "Strategy", "Funding",
+            "Innovation", "Sales", "Culture", "Regulation", "Pricing", "Partnership", "Technology", "Operations", "Brand", "Talent"]
+STATEMENTS = ["is happening", "is strong", "is changing", "needs attention", "drives value", "is under pressure",
+              "is a priority", "creates opportunity", "is uncertain", "keeps improving"]
+QUALIFIERS = ["", "Continuous", "Rapid", "Local", "Global", "Early", "Sustainable", "Hidden", "Shared", "New"]
+
+
+#a pool of distinct storypoint strings, e.g. "Rapid Growth is happening".
+def storypoint_pool(size, seed=0):
+     rng = random.Random(seed)
+     pool = set()
+     while len(pool) < size:
+          words = [rng.choice(QUALIFIERS), rng.choice(SUBJECTS), rng.choice(STATEMENTS)]
+          if len(pool) > len(QUALIFIERS) * len(SUBJECTS) * len(STATEMENTS) // 2:
+               words.append(str(rng.randint(1, size * 10)))
+          pool.add(" ".join(word for word in words if word))
+     return sorted(pool)
+
+#context rows for a library with about `storypoints` slide/storypoint pairs, same keys as the real graph query.
+#distinct_ratio is how many of the pairs use a storypoint string of their own (the rest repeat one).
+#big libraries get bigger decks, so there are never more than 1000 decks (the app's slide names have 3 digit deck numbers).
+def synthetic_context(storypoints, slides_per_deck=25, distinct_ratio=0.3, seed=0):
+     rng = random.Random(seed)
+     slides_per_deck = max(slides_per_deck, -(-storypoints // 1000))
+     pool = storypoint_pool(max(1, int(storypoints * distinct_ratio)), seed)
+     rows = []
+     deck, slide = 0, 0
+     while len(rows) < storypoints:
+          name = f"deck_{deck:03d}_slide_{slide:04d}"
+          topic = f"{rng.choice(SUBJECTS)} {rng.choice(SUBJECTS)}"
+          for _ in range(rng.randint(1, 3)):
+               rows.append({"SlideName": name, "TopicName": topic, "StorypointName": rng.choice(pool), "UpdatedAt": deck * 10000 + slide})
+          slide += 1
+          if slide == slides_per_deck:
+               deck, slide = deck + 1, 0
+     return rows[:storypoints]
+
+#storyline points to match, phrased like what slide_deck_storyline() gives back.
+def synthetic_storyline(length, seed=0):
+     rng = random.Random(seed)
+     return [f"{rng.choice(QUALIFIERS)} {rng.choice(SUBJECTS).lower()} {rng.choice(STATEMENTS)} in our business".strip()
+             for _ in range(length)]
+
+
+## FAKE GRAPH
+# ---------------------------------------------------------------------------------------------------------------------
+
+#stands in for langchain's Neo4jGraph: answers the context queries from graph_context.py with the synthetic rows.
+class FakeGraph:
+     def __init__(self, rows):
+          self.rows = rows
+          self.queries = 0
+
+     def query(self, query, params={}):
+          self.queries += 1
+          if "count(DISTINCT slide)" in query:
+               return [{"SlideCount": len({row["SlideName"] for row in self.rows})}]
+          if "$since" in query:
+               return [row for row in self.rows if row["UpdatedAt"] > params["since"]]
+          return self.rows
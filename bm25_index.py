@@ -0,0 +1,143 @@
+# Importing the necessary Python libraries
+import re
+import math
+import threading
+from collections import Counter
+import numpy as np
+
+#words that say nothing about what a slide is about.
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is", "it", "its",
+             "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with", "how", "what", "why"}
+
+
+#lowercase words without stopwords, with a very light plural stemming so "risks" finds "risk".
+def tokenize(text):
+     tokens = []
+     for word in re.findall(r"[a-z0-9]+", str(text).lower()):
+          if word in STOPWORDS:
+               continue
+          if len(word) > 4 and word.endswith("ies"):
+               word = word[:-3] + "y"
+          elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+               word = word[:-1]
+          tokens.append(word)
+     return tokens
+
+#everything we know about a slide from the context rows: its name, topics and storypoints.
+def slide_texts(rows):
+     texts = {}
+     for row in rows:
+          parts = texts.setdefault(str(row["SlideName"]), [str(row["SlideName"])])
+          for key in ("TopicName", "StorypointName"):
+               if row.get(key) and str(row[key]) not in parts:
+                    parts.append(str(row[key]))
+     return {slide: " ".join(parts) for slide, parts in texts.items()}
+
+
+## BM25 INDEX
+# ---------------------------------------------------------------------------------------------------------------------
+
+#inverted index over the slides with BM25 scoring. no network, no LLM, so it always has an answer.
+#slides can be added and removed one by one, sync() does that for a whole new set of context rows.
+#every slide gets a number so the posting lists can be turned into numpy arrays and scored in one go per query term.
+class BM25Index:
+     def __init__(self, k1=1.5, b=0.75):
+          self.k1 = k1
+          self.b = b
+          self.postings = {}      #term -> {slide number: term frequency}
+          self.documents = {}     #slide name -> (slide number, text)
+          self.slide_names = []   #slide number -> slide name (None once removed)
+          self.free_numbers = []
+          self.lengths = np.zeros(64, dtype=np.float32)
+          self.total_length = 0
+          self.arrays = {}        #term -> (slide numbers, term frequencies) as numpy arrays, rebuilt when the term changes
+          self.lock = threading.RLock()
+
+     def __len__(self):
+          return len(self.documents)
+
+     def add(self, slide_name, text):
+          with self.lock:
+               if slide_name in self.documents:
+                    self.remove(slide_name)
+               if self.free_numbers:
+                    number = self.free_numbers.pop()
+                    self.slide_names[number] = slide_name
+               else:
+                    number = len(self.slide_names)
+                    self.slide_names.append(slide_name)
+                    if number >= len(self.lengths):
+                         self.lengths = np.concatenate([self.lengths, np.zeros(len(self.lengths), dtype=np.float32)])
+
+               counts = Counter(tokenize(text))
+               for term, frequency in counts.items():
+                    self.postings.setdefault(term, {})[number] = frequency
+                    self.arrays.pop(term, None)
+               length = sum(counts.values())
+               self.documents[slide_name] = (number, text)
+               self.lengths[number] = length
+               self.total_length += length
+
+     def remove(self, slide_name):
+          with self.lock:
+               if slide_name not in self.documents:
+                    return
+               number, text = self.documents.pop(slide_name)
+               for term in set(tokenize(text)):
+                    slides = self.postings.get(term)
+                    if slides is not None:
+                         slides.pop(number, None)
+                         self.arrays.pop(term, None)
+                         if not slides:
+                              del self.postings[term]
+               self.total_length -= int(self.lengths[number])
+               self.lengths[number] = 0
+               self.slide_names[number] = None
+               self.free_numbers.append(number)
+
+     #brings the index in line with new context rows, only touching slides that were added, removed or changed. returns the index.
+     def sync(self, rows):
+          texts = slide_texts(rows)
+          with self.lock:
+               for slide_name in [name for name in self.documents if name not in texts]:
+                    self.remove(slide_name)
+               for slide_name, text in texts.items():
+                    current = self.documents.get(slide_name)
+                    if current is None or current[1] != text:
+                         self.add(slide_name, text)
+          return self
+
+     @classmethod
+     def from_rows(cls, rows):
+          return cls().sync(rows)
+
+     def _term_arrays(self, term):
+          arrays = self.arrays.get(term)
+          if arrays is None:
+               slides = self.postings[term]
+               arrays = (np.fromiter(slides.keys(), dtype=np.int64, count=len(slides)),
+                         np.fromiter(slides.values(), dtype=np.float32, count=len(slides)))
+               self.arrays[term] = arrays
+          return arrays
+
+     #returns the k best slides as (slide name, score) pairs, best first. slides sharing no word with the query are left out.
+     def search(self, query, k=5):
+          with self.lock:
+               if not self.documents:
+                    return []
+               slide_count = len(self.documents)
+               average_length = self.total_length / slide_count or 1.0
+               scores = np.zeros(len(self.slide_names), dtype=np.float32)
+               for term in set(tokenize(query)):
+                    if term not in self.postings:
+                         continue
+                    numbers, frequencies = self._term_arrays(term)
+                    idf = math.log(1 + (slide_count - len(numbers) + 0.5) / (len(numbers) + 0.5))
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[numbers] / average_length)
+                    scores[numbers] += idf * frequencies * (self.k1 + 1) / (frequencies + norm)
+
+               hits = np.flatnonzero(scores > 0)
+               if len(hits) > k:
+                    hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+               hits = hits[np.argsort(-scores[hits], kind="stable")]
+               return [(self.slide_names[number], float(scores[number])) for number in hits]
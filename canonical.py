@@ -0,0 +1,245 @@
+# Importing the necessary Python libraries
+import os
+import re
+import json
+import time
+import argparse
+from collections import Counter
+import numpy as np
+from graph_context import context_fingerprint
+from tracing import span
+
+#the storypoints come out of the LLM (see PromptDiary.md), so the same point shows up under many names:
+#"Growth is happening", "Continuous Growth", "growth happens"... this clusters them into canonical storypoints.
+#
+#   1. normalize: lowercase, no punctuation, no filler words. storypoints with the same stems in any order are one storypoint.
+#   2. cluster: the most used storypoints go first and become canonical. every other storypoint joins the canonical one
+#      it is most similar to (cosine of the embeddings), if that is at least the threshold, or becomes canonical itself.
+#   3. the canonical name is the most used wording in the cluster.
+#
+#matching then searches the canonical storypoints and expands them to their slides (see canonical_rows), and
+#`python canonical.py` writes the clusters back to neo4j as STORYPOINT -[:canonicalAs]-> CANONICAL_STORYPOINT links.
+
+STOPWORDS = {"a", "an", "the", "is", "are", "was", "were", "be", "been", "being", "am", "of", "and", "or", "for", "to", "in",
+             "on", "at", "by", "with", "from", "as", "our", "we", "us", "it", "its", "this", "that", "these", "those", "their", "your"}
+SUFFIXES = ("ing", "ed", "es", "s", "ly")
+
+#how similar two storypoints have to be to be the same one. it depends on the embedder: the hashing embedder only sees
+#shared words and letters, the openai embeddings see meaning and give everything a high cosine. STORYPOINT_SIMILARITY overrides it.
+THRESHOLDS = {"hashing": 0.85, "openai": 0.92}
+
+
+## NORMALIZE
+# ---------------------------------------------------------------------------------------------------------------------
+
+#the words of a storypoint that carry meaning: "Growth is happening!" -> "growth happening".
+def normalize_storypoint(text):
+     words = re.findall(r"[a-z0-9]+", str(text).lower())
+     return " ".join(word for word in words if word not in STOPWORDS) or " ".join(words)
+
+#a very small stemmer, just enough for "happening" and "happens" to meet. short words and words ending in ss stay as they are.
+def stem(word):
+     for suffix in SUFFIXES:
+          if len(word) > len(suffix) + 3 and word.endswith(suffix) and not word.endswith("ss"):
+               return word[:-len(suffix)]
+     return word
+
+#storypoints with the same key are the same storypoint, whatever the order of the words: "Strong Revenue" and "Revenue is strong".
+def storypoint_key(text):
+     return " ".join(sorted({stem(word) for word in normalize_storypoint(text).split()}))
+
+def similarity_threshold(embedder):
+     if os.getenv("STORYPOINT_SIMILARITY"):
+          return float(os.getenv("STORYPOINT_SIMILARITY"))
+     return THRESHOLDS.get(embedder.name.partition("-")[0], 0.85)
+
+
+## CLUSTER
+# ---------------------------------------------------------------------------------------------------------------------
+
+#maps every storypoint to its canonical storypoint. counts is how often each storypoint is used (slides), the most used
+#wording names a cluster. canonical are canonical storypoints from before (a saved mapping, or the graph): they keep their
+#names and come first, the storypoints can join them or start clusters of their own. the storypoints are compared in
+#blocks against the canonical ones found so far, so it never needs the full storypoints x storypoints matrix.
+def canonicalize(storypoints, counts=None, embedder=None, threshold=None, canonical=(), block_size=512):
+     from slide_index import get_embedder
+     embedder = embedder or get_embedder()
+     threshold = similarity_threshold(embedder) if threshold is None else threshold
+     counts = counts or {}
+     canonical = list(dict.fromkeys(str(name) for name in canonical))
+
+     #step 1, exact duplicates after normalizing. every group is named by its most used wording (then the shortest).
+     groups = {}
+     for storypoint in dict.fromkeys(str(storypoint) for storypoint in storypoints):
+          groups.setdefault(storypoint_key(storypoint), []).append(storypoint)
+     known = {storypoint_key(name): name for name in canonical}
+     mapping, named = {}, []
+     for key, members in groups.items():
+          if key in known:
+               mapping.update((storypoint, known[key]) for storypoint in members)
+               continue
+          name = min(members, key=lambda storypoint: (-counts.get(storypoint, 1), len(storypoint), storypoint))
+          named.append((-sum(counts.get(storypoint, 1) for storypoint in members), len(name), name, members))
+     named.sort(key=lambda group: group[:3])
+     if not named:
+          return mapping
+
+     #step 2, near duplicates. a group either joins the most similar canonical storypoint before it or becomes canonical.
+     with span("canonical.cluster", storypoints=len(named), canonical=len(canonical)):
+          vectors = embedder.embed([normalize_storypoint(name) for _, _, name, _ in named])
+          leaders = embedder.embed([normalize_storypoint(name) for name in canonical]) if canonical else vectors[:0]
+          for start in range(0, len(named), block_size):
+               block = vectors[start:start + block_size]
+               scores = block @ leaders.T
+               best = scores.argmax(axis=1) if scores.shape[1] else np.zeros(len(block), dtype=np.int64)
+               best_scores = scores.max(axis=1) if scores.shape[1] else np.full(len(block), -1.0)
+               new = np.zeros_like(block)    #canonical storypoints found in this block, they aren't in scores yet
+               found = 0
+               for offset, vector in enumerate(block):
+                    leader, score = int(best[offset]), float(best_scores[offset])
+                    if found:
+                         new_scores = new[:found] @ vector
+                         if float(new_scores.max()) > score:
+                              leader, score = len(leaders) + int(np.argmax(new_scores)), float(new_scores.max())
+                    name, members = named[start + offset][2:]
+                    if score < threshold:
+                         leader = len(canonical)
+                         canonical.append(name)
+                         new[found] = vector
+                         found += 1
+                    mapping.update((storypoint, canonical[leader]) for storypoint in members)
+               leaders = np.vstack([leaders, new[:found]])
+     return mapping
+
+#canonicalize() for context rows, storypoints used by more slides weigh more. known is a mapping from before (saved, or
+#read from the graph): its storypoints keep their canonical storypoint and only the new ones are clustered, against those.
+def canonicalize_rows(rows, embedder=None, threshold=None, known=None):
+     counts = Counter(str(row["StorypointName"]) for row in rows)
+     known = known or {}
+     mapping = {storypoint: known[storypoint] for storypoint in counts if storypoint in known}
+     new = [storypoint for storypoint in counts if storypoint not in mapping]
+     mapping.update(canonicalize(new, counts, embedder, threshold, canonical=mapping.values()))
+     return mapping
+
+#the mapping is saved (path.json, next to the slide index) so a restart doesn't cluster everything again. when the context
+#changed, storypoints that are gone are dropped and only the new ones are clustered, against the canonical storypoints
+#that are already there. that is quick, and the canonical names don't move around between refreshes.
+def load_or_build_canonical(rows, path, embedder=None, threshold=None):
+     from slide_index import get_embedder
+     embedder = embedder or get_embedder()
+     threshold = similarity_threshold(embedder) if threshold is None else threshold
+     fingerprint = context_fingerprint(rows)
+     saved = {}
+     try:
+          with open(f"{path}.json", encoding="utf-8") as file:
+               sidecar = json.load(file)
+          if sidecar["embedder"] == embedder.name and sidecar["threshold"] == threshold:
+               if sidecar["fingerprint"] == fingerprint:
+                    return sidecar["mapping"]
+               saved = sidecar["mapping"]
+     except (OSError, ValueError, KeyError):
+          pass
+
+     mapping = canonicalize_rows(rows, embedder, threshold, known=saved)
+     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+     temp_path = f"{path}.{os.getpid()}.tmp"
+     with open(temp_path, "w", encoding="utf-8") as file:
+          json.dump({"embedder": embedder.name, "threshold": threshold, "fingerprint": fingerprint, "mapping": mapping}, file)
+     os.replace(temp_path, f"{path}.json")
+     return mapping
+
+#the context rows with every storypoint replaced by its canonical one, one row per slide and canonical storypoint.
+#storypoints that aren't in the mapping stay as they are.
+def canonical_rows(rows, mapping):
+     seen = set()
+     result = []
+     for row in rows:
+          storypoint = mapping.get(str(row["StorypointName"]), row["StorypointName"])
+          if (row["SlideName"], storypoint) in seen:
+               continue
+          seen.add((row["SlideName"], storypoint))
+          result.append(dict(row, StorypointName=storypoint))
+     return result
+
+#canonical storypoint -> its storypoints, the biggest clusters first.
+def clusters(mapping):
+     members = {}
+     for storypoint, canonical in mapping.items():
+          members.setdefault(canonical, []).append(storypoint)
+     return dict(sorted(members.items(), key=lambda item: (-len(item[1]), item[0])))
+
+
+## NEO4J
+# ---------------------------------------------------------------------------------------------------------------------
+
+CANONICAL_CONSTRAINT_QUERY = "CREATE CONSTRAINT canonical_storypoint_name IF NOT EXISTS FOR (node:CANONICAL_STORYPOINT) REQUIRE node.name IS UNIQUE"
+
+#a storypoint has one canonical storypoint: the old link goes when the storypoint moves to another cluster.
+WRITE_CANONICAL_QUERY = """
+            UNWIND $links AS link
+            MATCH (storypoint:STORYPOINT {name: link.storypoint})
+            OPTIONAL MATCH (storypoint)-[old:canonicalAs]->(:CANONICAL_STORYPOINT)
+            DELETE old
+            WITH DISTINCT storypoint, link
+            MERGE (canonical:CANONICAL_STORYPOINT {name: link.canonical})
+            MERGE (storypoint)-[:canonicalAs]->(canonical)
+            """
+
+#canonical storypoints nothing links to anymore.
+DELETE_ORPHANS_QUERY = """
+            MATCH (canonical:CANONICAL_STORYPOINT)
+            WHERE NOT (canonical)<-[:canonicalAs]-(:STORYPOINT)
+            DETACH DELETE canonical
+            """
+
+READ_CANONICAL_QUERY = """
+            MATCH (storypoint:STORYPOINT)-[:canonicalAs]->(canonical:CANONICAL_STORYPOINT)
+            RETURN storypoint.name AS StorypointName, canonical.name AS CanonicalName;
+            """
+
+def write_canonical_links(graph, mapping, batch_size=1000):
+     links = [{"storypoint": storypoint, "canonical": canonical} for storypoint, canonical in sorted(mapping.items())]
+     for start in range(0, len(links), batch_size):
+          with span("canonical.write", links=len(links[start:start + batch_size])):
+               graph.query(WRITE_CANONICAL_QUERY, params={"links": links[start:start + batch_size]})
+     graph.query(DELETE_ORPHANS_QUERY)
+     return len(links)
+
+#the mapping as it is in the graph, storypoint -> canonical storypoint.
+def read_canonical_links(graph):
+     return {row["StorypointName"]: row["CanonicalName"] for row in graph.query(READ_CANONICAL_QUERY)}
+
+
+if __name__ == "__main__":
+     from dotenv import load_dotenv
+     from graph_context import CONTEXT_QUERY
+     from slide_index import get_embedder
+     from slide_pipeline import connect_graph
+     load_dotenv()
+
+     parser = argparse.ArgumentParser(description="Cluster near duplicate storypoints and link them to canonical storypoints in the knowledge graph.")
+     parser.add_argument("--threshold", type=float, default=None, help="cosine similarity to join a cluster (default by embedder, or STORYPOINT_SIMILARITY)")
+     parser.add_argument("--embedder", default=None, help="hashing or openai (default SLIDE_EMBEDDER)")
+     parser.add_argument("--batch-size", type=int, default=1000, help="links per neo4j transaction")
+     parser.add_argument("--show", type=int, default=10, help="print the biggest clusters")
+     parser.add_argument("--dry-run", action="store_true", help="only print the clusters, don't write them")
+     parser.add_argument("--rebuild", action="store_true", help="cluster every storypoint again instead of keeping the links in the graph")
+     args = parser.parse_args()
+
+     graph = connect_graph()
+     rows = graph.query(CONTEXT_QUERY)
+     started = time.time()
+     known = {} if args.rebuild else read_canonical_links(graph)
+     mapping = canonicalize_rows(rows, get_embedder(args.embedder), args.threshold, known)
+     members = clusters(mapping)
+     print(f"{len(mapping)} storypoints in {len(members)} canonical storypoints ({len(mapping) / max(len(members), 1):.1f}x fewer), "
+           f"{len(rows)} slide/storypoint pairs -> {len(canonical_rows(rows, mapping))}, in {time.time() - started:.1f}s")
+     for canonical, storypoints in list(members.items())[:args.show]:
+          print(f"  {canonical}: " + ", ".join(storypoint for storypoint in storypoints if storypoint != canonical)[:200])
+
+     if not args.dry_run:
+          try:
+               graph.query(CANONICAL_CONSTRAINT_QUERY)
+          except Exception as error:
+               print(f"Error: could not create constraint ({error})")
+          print(f"Wrote {write_canonical_links(graph, mapping, args.batch_size)} canonical links")
@@ -0,0 +1,183 @@
+# Importing the necessary Python libraries
+import os
+import sys
+import json
+import time
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from fanout import iter_completed
+from slide_assets import slide_id_in
+
+#the pipeline without the UI, for scripts, cron jobs and other services. topics go in, one json line per topic comes out
+#as soon as that topic is done (storyline, matched slides and optionally html slides). many topics run at the same time.
+#
+#   python cli.py run topics.txt --slides 5 --html --output decks.jsonl
+#   python cli.py serve --port 8000
+#   curl -N localhost:8000/run -d '{"topics": ["Risk Management in Venture Capital"], "slides": 5}'
+#
+#a topics file has one topic per line, or json lines like {"topic": "...", "slides": 8}.
+
+#how many topics are worked on at the same time. every topic also matches its slides concurrently (SLIDE_MAX_WORKERS),
+#the shared llm client keeps the total inside the openai limits.
+TOPIC_WORKERS = int(os.getenv("SLIDE_TOPIC_WORKERS", 4))
+
+
+def read_topics(lines, nr_of_slides=5):
+     jobs = []
+     for line in lines:
+          line = line.strip()
+          if not line or line.startswith("#"):
+               continue
+          job = json.loads(line) if line.startswith("{") else {"topic": line}
+          job.setdefault("slides", nr_of_slides)
+          jobs.append(job)
+     return jobs
+
+#one topic from start to end. returns the json record for it.
+def run_topic(pipeline, job, match=True, batch=False, html=False):
+     started = time.perf_counter()
+     storyline_map, nested, pretty = pipeline.slide_deck_storyline(job["topic"], job["slides"])
+     record = {"topic": job["topic"], "storyline": nested[0]}
+     if match:
+          png_paths_nested, _ = (pipeline.process_list_batch if batch else pipeline.process_list_AI)(nested)
+          record["slides"] = [slide_id_in(path) for path in png_paths_nested[0]]
+          record["images"] = png_paths_nested[0]
+     if html:
+          html_code_nested, _ = pipeline.html_AI(nested)
+          record["html"] = html_code_nested[0]
+     record["seconds"] = round(time.perf_counter() - started, 2)
+     return record
+
+#runs every job with at most max_workers topics in flight and yields the records in the order they finish.
+#a topic that fails gives a record with an "error" instead of stopping the others.
+def iter_results(pipeline, jobs, max_workers=TOPIC_WORKERS, match=True, batch=False, html=False):
+     def failed(job, error):
+          print(f"Error: could not process '{job['topic']}': {error}", file=sys.stderr)
+          return {"topic": job["topic"], "error": f"{type(error).__name__}: {error}"}
+
+     for position, record in iter_completed(lambda job: run_topic(pipeline, job, match, batch, html), jobs, max_workers, on_error=failed):
+          record["index"] = position
+          yield record
+
+
+## HTTP API
+# ---------------------------------------------------------------------------------------------------------------------
+
+#POST /run with {"topics": [...], "slides": 5, "match": true, "batch": false, "html": false} streams one json line per topic.
+#GET /health answers {"ok": true}.
+def serve(pipeline, host="127.0.0.1", port=8000, max_workers=TOPIC_WORKERS):
+     class Handler(BaseHTTPRequestHandler):
+          def log_message(self, *args):
+               pass
+
+          def send_json(self, status, payload):
+               data = json.dumps(payload).encode("utf-8")
+               self.send_response(status)
+               self.send_header("Content-Type", "application/json")
+               self.send_header("Content-Length", str(len(data)))
+               self.end_headers()
+               self.wfile.write(data)
+
+          def do_GET(self):
+               if self.path.split("?")[0] != "/health":
+                    self.send_error(404)
+                    return
+               self.send_json(200, {"ok": True})
+
+          def do_POST(self):
+               if self.path.split("?")[0] != "/run":
+                    self.send_error(404)
+                    return
+               try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                    nr_of_slides = int(request.get("slides", 5))
+                    jobs = [dict(topic) if isinstance(topic, dict) else {"topic": str(topic)} for topic in request["topics"]]
+                    for job in jobs:
+                         job.setdefault("slides", nr_of_slides)
+               except (ValueError, KeyError, TypeError) as error:
+                    self.send_json(400, {"error": f"bad request: {error}"})
+                    return
+
+               #no content length, the lines are written as they come and the connection closes at the end.
+               self.send_response(200)
+               self.send_header("Content-Type", "application/x-ndjson")
+               self.end_headers()
+               for record in iter_results(pipeline, jobs, max_workers, request.get("match", True), request.get("batch", False), request.get("html", False)):
+                    self.wfile.write((json.dumps(record) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+
+     server = ThreadingHTTPServer((host, port), Handler)
+     server.daemon_threads = True
+     return server
+
+
+## CLI
+# ---------------------------------------------------------------------------------------------------------------------
+
+def main(argv=None):
+     parser = argparse.ArgumentParser(description="Build storylines and find slides for many topics without the UI.")
+     commands = parser.add_subparsers(dest="command", required=True)
+
+     run = commands.add_parser("run", help="process a file of topics and write json lines")
+     run.add_argument("topics", help="topics file, - for stdin")
+     run.add_argument("--output", "-o", help="jsonl file to append to (default: stdout)")
+     run.add_argument("--resume", action="store_true", help="skip topics that are already in the output file")
+
+     api = commands.add_parser("serve", help="serve the pipeline as a small http json api")
+     api.add_argument("--host", default="127.0.0.1")
+     api.add_argument("--port", type=int, default=8000)
+
+     for command in (run, api):
+          command.add_argument("--slides", type=int, default=5, help="slides per storyline (unless the topic says otherwise)")
+          command.add_argument("--workers", type=int, default=None, help="topics processed at the same time (default SLIDE_TOPIC_WORKERS)")
+          command.add_argument("--no-match", action="store_true", help="only build the storylines")
+          command.add_argument("--batch", action="store_true", help="match each storyline at once (distinct slides)")
+          command.add_argument("--html", action="store_true", help="also build the html slides")
+          command.add_argument("--metrics-port", type=int, default=None, help="default SLIDE_METRICS_PORT")
+     args = parser.parse_args(argv)
+
+     from dotenv import load_dotenv
+     import openai
+     from tracing import configure_tracing, start_metrics_server
+     from slide_pipeline import SlidePipeline
+     load_dotenv()
+     configure_tracing()
+     openai.api_key = os.getenv("OPENAI_API_KEY")
+     #the defaults that come from .env are only known now.
+     args.workers = args.workers or int(os.getenv("SLIDE_TOPIC_WORKERS") or TOPIC_WORKERS)
+     args.metrics_port = args.metrics_port or int(os.getenv("SLIDE_METRICS_PORT") or 0)
+     pipeline = SlidePipeline.from_env()
+     if args.metrics_port:
+          start_metrics_server(args.metrics_port)
+
+     if args.command == "serve":
+          server = serve(pipeline, args.host, args.port, args.workers)
+          print(f"Serving on http://{args.host}:{args.port}/run", file=sys.stderr)
+          server.serve_forever()
+          return
+
+     with (sys.stdin if args.topics == "-" else open(args.topics, encoding="utf-8")) as file:
+          jobs = read_topics(file, args.slides)
+     if args.resume and args.output and os.path.exists(args.output):
+          with open(args.output, encoding="utf-8") as file:
+               records = [json.loads(line) for line in file if line.strip()]
+          done = {record["topic"] for record in records if "error" not in record}
+          jobs = [job for job in jobs if job["topic"] not in done]
+
+     output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+     finished, failed = 0, 0
+     try:
+          for record in iter_results(pipeline, jobs, args.workers, not args.no_match, args.batch, args.html):
+               output.write(json.dumps(record) + "\n")
+               output.flush()
+               finished += 1
+               failed += "error" in record
+               print(f"Completed ({finished}/{len(jobs)}) {record['topic']}", file=sys.stderr)
+     finally:
+          if output is not sys.stdout:
+               output.close()
+     print(f"{finished - failed} topics done, {failed} failed.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+     main()
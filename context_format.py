@@ -0,0 +1,146 @@
+# Importing the necessary Python libraries
+import re
+import sys
+import json
+from functools import lru_cache
+
+#without tiktoken the shards only get this share of their token budget, the characters / 4 estimate can be well off.
+ESTIMATE_MARGIN = 0.75
+
+
+#the tiktoken encoding of a model, or None without tiktoken (or when it can't download the encoding, e.g. offline).
+#it is only imported when tokens are counted. the answer is kept, so the warning comes once and the download is tried once.
+@lru_cache(maxsize=None)
+def tokenizer(model="gpt-3.5-turbo-1106"):
+     try:
+          import tiktoken
+          try:
+               return tiktoken.encoding_for_model(model)
+          except KeyError:
+               return tiktoken.get_encoding("cl100k_base")
+     except Exception as error:
+          print(f"Error: no tokenizer for {model} ({type(error).__name__}: {error}). token counts are estimated at ~4 characters "
+                f"per token, so the shard budgets are only estimates. install tiktoken and let it download its encoding once.", file=sys.stderr)
+          return None
+
+#exact token counts with tiktoken, the usual ~4 characters per token without it.
+def count_tokens(text, model="gpt-3.5-turbo-1106"):
+     encoding = tokenizer(model)
+     if encoding is None:
+          return (len(text) + 3) // 4
+     return len(encoding.encode(text))
+
+
+## COMPACT CONTEXT
+# ---------------------------------------------------------------------------------------------------------------------
+
+#the raw graph rows repeat the 'SlideName'/'StorypointName' keys, the full deck_XXX_slide_YYYY name and every shared storypoint on every row.
+#this groups the storypoints per slide, writes every storypoint once with a number, and gives every slide a short id:
+#
+#   storypoints:
+#   1 Growth is happening
+#   2 Competition is strong
+#   slides (id: storypoints):
+#   s1: 1 2
+#
+#the LLM answers with the short id and resolve() maps it back to the exact slide name.
+class CompactContext:
+     def __init__(self, text, aliases):
+          self.text = text
+          self.aliases = aliases  #short id -> slide name
+
+     def __str__(self):
+          return self.text
+
+     #returns the slide name for the first known id in the answer, or None.
+     def resolve(self, answer):
+          for alias in re.findall(r"\bs\d+\b", answer or ""):
+               if alias in self.aliases:
+                    return self.aliases[alias]
+          return None
+
+
+def encode_context(rows):
+     by_slide = {}
+     storypoint_ids = {}
+     for row in rows:
+          storypoint = str(row["StorypointName"])
+          if storypoint not in storypoint_ids:
+               storypoint_ids[storypoint] = len(storypoint_ids) + 1
+          points = by_slide.setdefault(str(row["SlideName"]), [])
+          if storypoint_ids[storypoint] not in points:
+               points.append(storypoint_ids[storypoint])
+
+     lines = ["storypoints:"]
+     lines += [f"{number} {storypoint}" for storypoint, number in storypoint_ids.items()]
+     lines.append("slides (id: storypoints):")
+     aliases = {}
+     for nr, (slide_name, points) in enumerate(by_slide.items(), start=1):
+          aliases[f"s{nr}"] = slide_name
+          lines.append(f"s{nr}: " + " ".join(str(point) for point in points))
+     return CompactContext("\n".join(lines), aliases)
+
+
+## SHARDS
+# ---------------------------------------------------------------------------------------------------------------------
+
+#the deck a slide belongs to (deck_000 for deck_000_slide_0000), slides with other names are a deck of their own.
+def deck_of(slide_name):
+     match = re.match(r"deck_\d+", slide_name)
+     return match.group(0) if match else slide_name
+
+#splits the rows into shards whose compact encoding fits into max_tokens (counted with the tokenizer, see count_tokens).
+#whole decks are packed together until a shard is full. a deck that doesn't fit on its own is split between its slides,
+#a single slide bigger than the budget gets a shard of its own. every shard can be encoded and sent on its own.
+def shard_rows(rows, max_tokens=6000, model="gpt-3.5-turbo-1106"):
+     #the budget is a hard prompt limit and needs real token counts (tiktoken). with only the estimate (tokenizer() has
+     #warned about it) part of the budget is kept free.
+     if tokenizer(model) is None:
+          max_tokens = int(max_tokens * ESTIMATE_MARGIN)
+     decks = {}
+     for row in rows:
+          slides = decks.setdefault(deck_of(str(row["SlideName"])), {})
+          slides.setdefault(str(row["SlideName"]), []).append(row)
+
+     #(rows, tokens) pieces in deck order, packed into shards by their own token counts.
+     pieces = []
+     for slides in decks.values():
+          deck_rows = [row for slide_rows in slides.values() for row in slide_rows]
+          tokens = count_tokens(encode_context(deck_rows).text, model)
+          if tokens <= max_tokens:
+               pieces.append((deck_rows, tokens))
+          else:
+               pieces += [(slide_rows, count_tokens(encode_context(slide_rows).text, model)) for slide_rows in slides.values()]
+
+     shards, group = [], []
+     for nr, (piece, tokens) in enumerate(pieces):
+          group.append((piece, tokens))
+          last = nr == len(pieces) - 1
+          while group and (last or sum(tokens for _, tokens in group) + pieces[nr + 1][1] > max_tokens):
+               #the sum is only an estimate (the storypoint numbers get longer in a bigger shard), the exact count decides.
+               #pieces that don't fit anymore move on to the next shard.
+               carry = []
+               while len(group) > 1 and count_tokens(encode_context([row for piece, _ in group for row in piece]).text, model) > max_tokens:
+                    carry.insert(0, group.pop())
+               shards.append([row for piece, _ in group for row in piece])
+               group = carry
+               if not last:
+                    break
+     return shards
+
+
+#compares the tokens of the raw rows (what used to go into the prompt) with the compact encoding.
+def token_report(rows, model="gpt-3.5-turbo-1106"):
+     before = count_tokens(f"{list(rows)}", model)
+     after = count_tokens(encode_context(rows).text, model)
+     return {"rows": len(rows), "tokens_before": before, "tokens_after": after,
+             "reduction": round(before / after, 2) if after else None}
+
+
+#prints the token report for a context snapshot file, e.g. python context_format.py .slide_cache/context_snapshot.json
+if __name__ == "__main__":
+     path = sys.argv[1] if len(sys.argv) > 1 else ".slide_cache/context_snapshot.json"
+     with open(path, encoding="utf-8") as file:
+          snapshot = json.load(file)
+     rows = [{"SlideName": row[0], "StorypointName": row[1]} for row in snapshot["rows"]]
+     print(json.dumps(token_report(rows), indent=2))
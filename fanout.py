@@ -0,0 +1,102 @@
+# Importing the necessary Python libraries
+import os
+import queue
+import threading
+import contextvars
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+#how many slides are worked on at the same time. the openai client spends most of its time waiting, so threads are enough.
+#this is read when the module is imported, usually before load_dotenv(): SlidePipeline.from_env() reads SLIDE_MAX_WORKERS again.
+MAX_WORKERS = int(os.getenv("SLIDE_MAX_WORKERS", 8))
+
+
+#runs func on every item with at most max_workers calls in flight and yields (position, result) as soon as each one finishes.
+#if a call raises, on_error(item, exception) is yielded in its place instead of aborting the whole batch.
+def iter_completed(func, items, max_workers=MAX_WORKERS, on_error=None):
+     items = list(items)
+     if not items:
+          return
+     pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))))
+     try:
+          #every call runs in a copy of the caller's context, so tracing spans in the workers keep their parent.
+          futures = {pool.submit(contextvars.copy_context().run, func, item): position for position, item in enumerate(items)}
+          for future in as_completed(futures):
+               position = futures[future]
+               try:
+                    result = future.result()
+               except Exception as error:
+                    if on_error is None:
+                         raise
+                    result = on_error(items[position], error)
+               yield position, result
+     finally:
+          #if the caller stops early (e.g. a UI run the user replaced with a new one), the calls that haven't started are
+          #dropped and the caller doesn't wait for the ones still running.
+          pool.shutdown(wait=False, cancel_futures=True)
+
+
+#same as iter_completed but waits for everything and returns the results in the order of items.
+#progress(done, total) is called after every finished item.
+def map_ordered(func, items, max_workers=MAX_WORKERS, on_error=None, progress=None):
+     items = list(items)
+     results = [None] * len(items)
+     done = 0
+     for position, result in iter_completed(func, items, max_workers, on_error):
+          results[position] = result
+          done += 1
+          if progress is not None:
+               progress(done, len(items))
+     return results
+
+
+#yields (results so far, position that just finished) after every finished item. unfinished items are None.
+#this is what lets the UI show the first slides while the rest of the storyline is still being worked on.
+def iter_partial(func, items, max_workers=MAX_WORKERS, on_error=None):
+     items = list(items)
+     results = [None] * len(items)
+     for position, result in iter_completed(func, items, max_workers, on_error):
+          results[position] = result
+          yield list(results), position
+
+
+#for functions that are generators (e.g. a slide streamed from the LLM): runs func on every item like iter_completed and
+#yields (position, value, False) for every value any of them yields, then (position, last value, True) when one is done.
+#if a call raises, its last value is on_error(item, exception) instead of aborting the whole batch.
+#if the caller stops early, the streams still going are closed at their next value.
+def iter_streams(func, items, max_workers=MAX_WORKERS, on_error=None):
+     items = list(items)
+     if not items:
+          return
+     events = queue.Queue()
+     stopped = threading.Event()
+
+     def run(position, item):
+          last = None
+          try:
+               with closing(func(item)) as stream:
+                    for last in stream:
+                         if stopped.is_set():
+                              return
+                         events.put((position, last, False))
+          except Exception as error:
+               if on_error is None:
+                    events.put((position, error, None))
+                    return
+               last = on_error(item, error)
+          events.put((position, last, True))
+
+     pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))))
+     try:
+          for position, item in enumerate(items):
+               pool.submit(contextvars.copy_context().run, run, position, item)
+          remaining = len(items)
+          while remaining:
+               position, value, done = events.get()
+               if done is None:
+                    raise value
+               remaining -= done
+               yield position, value, done
+     finally:
+          stopped.set()
+          pool.shutdown(wait=False, cancel_futures=True)
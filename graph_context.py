@@ -0,0 +1,215 @@
+# Importing the necessary Python libraries
+import os
+import json
+import time
+import hashlib
+import threading
+from tracing import span
+
+#the default schema matches slides to storypoints. updated_at is set when a slide is (re)ingested and lets us pull only what changed.
+CONTEXT_QUERY = """
+            MATCH (slide:SLIDE)-[:hasTopic]->(topic:TOPIC)-[:hasStorypoint]->(storypoint:STORYPOINT)
+            RETURN slide.name AS SlideName, topic.name AS TopicName, storypoint.name AS StorypointName, slide.updated_at AS UpdatedAt;
+            """
+
+INCREMENTAL_CONTEXT_QUERY = """
+            MATCH (slide:SLIDE)-[:hasTopic]->(topic:TOPIC)-[:hasStorypoint]->(storypoint:STORYPOINT)
+            WHERE slide.updated_at > $since
+            RETURN slide.name AS SlideName, topic.name AS TopicName, storypoint.name AS StorypointName, slide.updated_at AS UpdatedAt;
+            """
+
+#a cheap check that catches slides that were added or removed without an updated_at timestamp.
+SLIDE_COUNT_QUERY = """
+            MATCH (slide:SLIDE)-[:hasTopic]->(:TOPIC)-[:hasStorypoint]->(:STORYPOINT)
+            RETURN count(DISTINCT slide) AS SlideCount;
+            """
+
+
+#a stable hash of the context rows, used to tell whether anything built from the context is still up to date.
+def context_fingerprint(context):
+     pairs = sorted((str(row["SlideName"]), str(row["StorypointName"]), str(row.get("TopicName") or "")) for row in context)
+     return hashlib.sha256(json.dumps(pairs).encode("utf-8")).hexdigest()
+
+#the graph returns an UpdatedAt column for syncing, but the rest of the app only wants the slide, topic and storypoint.
+def _row(slide_name, storypoint_name, topic_name=None):
+     row = {"SlideName": slide_name, "StorypointName": storypoint_name}
+     if topic_name is not None:
+          row["TopicName"] = topic_name
+     return row
+
+def _split_rows(result):
+     rows = [_row(row["SlideName"], row["StorypointName"], row.get("TopicName")) for row in result]
+     stamps = [row.get("UpdatedAt") for row in result if row.get("UpdatedAt") is not None]
+     return rows, max(stamps, default=None)
+
+
+## CONTEXT PROVIDER
+# ---------------------------------------------------------------------------------------------------------------------
+
+#gives the rest of the app the SLIDE->TOPIC->STORYPOINT rows (SlideName, TopicName, StorypointName) without blocking on neo4j at import time.
+#the rows are loaded on first use, from the local snapshot file if there is one (warm start) and otherwise from the graph.
+#after that they are refreshed in the background, pulling only the slides whose updated_at changed since the last sync.
+class ContextProvider:
+     def __init__(self, graph_factory, snapshot_path=".slide_cache/context_snapshot.json", refresh_interval=None,
+                  full_refresh_every=12, query=CONTEXT_QUERY, incremental_query=INCREMENTAL_CONTEXT_QUERY):
+          self.graph_factory = graph_factory            #called once, when the graph is first needed
+          self.snapshot_path = snapshot_path
+          self.refresh_interval = refresh_interval      #seconds between background refreshes, None to only refresh on demand
+          self.full_refresh_every = full_refresh_every  #every n-th refresh re-reads everything to catch deletions and renames
+          self.query = query
+          self.incremental_query = incremental_query
+
+          self._graph = None
+          self._rows = None
+          self._version = None
+          self._synced_at = None
+          self._slide_count = None
+          self._refreshes = 0
+          self._subscribers = []
+          self._derived = {}
+          self._lock = threading.RLock()
+          self._derive_lock = threading.RLock()
+          self._refresher = None
+          self._stop = threading.Event()
+
+     def graph(self):
+          with self._lock:
+               if self._graph is None:
+                    self._graph = self.graph_factory()
+               return self._graph
+
+     #returns the current rows, loading them the first time.
+     def rows(self):
+          if self._rows is None:
+               self._load()
+          return self._rows
+
+     @property
+     def version(self):
+          self.rows()
+          return self._version
+
+     def __len__(self):
+          return len(self.rows())
+
+     def __iter__(self):
+          return iter(self.rows())
+
+     #callback(rows, version) runs after every load or refresh that changed the context.
+     def subscribe(self, callback):
+          self._subscribers.append(callback)
+          if self._rows is not None:
+               callback(self._rows, self._version)
+
+     #returns build(rows), rebuilt only when the context version changes. used for indexes that are derived from the context.
+     #if update(old value, rows) is given, an existing value is brought up to date with it instead of being built again.
+     #build and update can derive other values themselves (e.g. the slide index is built from the canonical rows).
+     def derive(self, name, build, update=None):
+          rows, version = self.rows(), self._version
+          with self._derive_lock:
+               cached = self._derived.get(name)
+               if cached is None:
+                    cached = (version, build(rows))
+               elif cached[0] != version:
+                    cached = (version, update(cached[1], rows) if update else build(rows))
+               self._derived[name] = cached
+               return cached[1]
+
+     def _load(self):
+          with self._lock:
+               if self._rows is not None:
+                    return
+               if self._read_snapshot():
+                    self._notify()
+                    #the snapshot might be old, so catch up in the background without holding up the first request.
+                    threading.Thread(target=self._safe_refresh, daemon=True).start()
+               else:
+                    self.refresh(full=True)
+          self.start_background_refresh()
+
+     #pulls changes from the graph. returns True if the context changed.
+     def refresh(self, full=False):
+          with self._lock:
+               graph = self.graph()
+               self._refreshes += 1
+               full = full or self._rows is None or self._synced_at is None or self._refreshes % self.full_refresh_every == 0
+               if not full:
+                    slide_count = graph.query(SLIDE_COUNT_QUERY)[0]["SlideCount"]
+                    full = slide_count != self._slide_count
+
+               if full:
+                    with span("context.query", full=True) as current:
+                         rows, synced_at = _split_rows(graph.query(self.query))
+                         current.set("rows", len(rows))
+               else:
+                    with span("context.query", full=False) as current:
+                         changed, synced_at = _split_rows(graph.query(self.incremental_query, params={"since": self._synced_at}))
+                         current.set("rows", len(changed))
+                    if not changed:
+                         return False
+                    changed_slides = {row["SlideName"] for row in changed}
+                    rows = [row for row in self._rows if row["SlideName"] not in changed_slides] + changed
+
+               version = context_fingerprint(rows)
+               if synced_at is not None:
+                    self._synced_at = max(synced_at, self._synced_at or synced_at)
+               self._slide_count = len({row["SlideName"] for row in rows})
+               if version == self._version:
+                    return False
+               self._rows, self._version = rows, version
+               self._write_snapshot()
+          self._notify()
+          return True
+
+     def start_background_refresh(self):
+          if self.refresh_interval is None or self._refresher is not None:
+               return
+          self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+          self._refresher.start()
+
+     def stop(self):
+          self._stop.set()
+
+     def _refresh_loop(self):
+          while not self._stop.wait(self.refresh_interval):
+               self._safe_refresh()
+
+     #background refreshes must never take the app down, e.g. when neo4j is briefly unreachable.
+     def _safe_refresh(self):
+          try:
+               self.refresh()
+          except Exception as error:
+               print(f"Error: could not refresh the graph context, keeping the current one: {error}")
+
+     def _notify(self):
+          for callback in self._subscribers:
+               try:
+                    callback(self._rows, self._version)
+               except Exception as error:
+                    print(f"Error: context subscriber failed: {error}")
+
+     def _read_snapshot(self):
+          try:
+               with open(self.snapshot_path, encoding="utf-8") as file:
+                    snapshot = json.load(file)
+          except (OSError, ValueError):
+               return False
+          self._rows = [_row(*row) for row in snapshot["rows"]]
+          self._version = snapshot["version"]
+          self._synced_at = snapshot.get("synced_at")
+          self._slide_count = snapshot.get("slide_count")
+          return True
+
+     #written to a temp file first so a crash never leaves half a snapshot behind.
+     def _write_snapshot(self):
+          os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+          snapshot = {"version": self._version,
+                      "synced_at": self._synced_at,
+                      "slide_count": self._slide_count,
+                      "saved": time.time(),
+                      "rows": [[row["SlideName"], row["StorypointName"], row.get("TopicName")] for row in self._rows]}
+          #the pid keeps the workers of a multi process UI from writing the same temp file.
+          temp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+          with open(temp_path, "w", encoding="utf-8") as file:
+               json.dump(snapshot, file)
+          os.replace(temp_path, self.snapshot_path)
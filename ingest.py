@@ -0,0 +1,339 @@
+# Importing the necessary Python libraries
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+import openai
+from llm_client import get_client
+from tracing import span, record_usage, configure_tracing
+from fanout import MAX_WORKERS
+
+try:
+     import pymupdf as fitz  #reads the text of the pdf pages and renders them to png
+except ImportError:
+     fitz = None
+
+#turns slide decks (pdfs) into the knowledge graph the app searches:
+#(:DECK)-[:hasSlide]->(:SLIDE)-[:hasTitle]->(:TITLE), (:SLIDE)-[:hasTopic]->(:TOPIC)-[:hasStorypoint]->(:STORYPOINT)
+#every page is one slide called deck_XXX_slide_YYYY, and is rendered to a png of the same name for the UI.
+#
+#   python ingest.py path/to/decks --png-dir path/to/slides_png
+#
+#pages are streamed one by one, the storypoint extraction runs concurrently (through the shared rate limited llm client),
+#and the slides are written to neo4j in batches. a manifest remembers a hash of every page, so a second run only
+#processes pages that changed, and a run that was stopped picks up where it left off.
+
+RELATIONS = ("hasTitle", "hasTopic", "hasStorypoint")
+MAX_NAME_LENGTH = 30
+
+#the extraction prompt from the 4th stage in PromptDiary.md, asking for a json object because of the json mode.
+EXTRACTION_PROMPT = """
+You are a knowledge graph builder.
+Your task is to assist me in contextualising raw text extracted from slides into a Knowledge Graph through a JSON format.
+
+The Slide Name is {slide_name}
+
+You will get the text extracted from only one of the slides of a slide deck.
+I want you to use the text from this slide and assist me in summarising
+the slide into its basic principles by understanding the stroypoint the slide conveys.
+
+For each slide there is a title and a topic. Each topic has between one and three story points.
+A story point  is represents the point a slide will make in a storyline. Slides
+with different topics should have the same abstract story points.
+
+You are to output relations between two objects in the form [object_1, relation, object_2].
+
+There are only three types of relations:
+1. "hasTitle"
+2. "hasTopic"
+3. "hasStorypoint"
+
+These are the rules:
+MOST IMPORTANT: the story points should never be specific. Keep them abstract.
+Never use information in the story points that you think is specific to this slide deck.
+VERY IMPORTANT: there should be no overlap between the story points and the slide title and slide topic.
+1. You will under no circumstance create more than 3 story points.
+2. The story point should be related to the message that this slide serves in a
+story line.
+3. Do NOT INVENT NEW RELATIONS.
+4. The story point should not be a mere summary, they should be detached
+from the specific content of the deck and generally focus on the kind of point
+this slide is trying to make.
+5. The story points should not be longer than 5 words.
+6. The story points will only be composed of of letters and numbers. NO SPECIAL CHARACTERS.
+
+Formatting Rules:
+No entity or relation should have more than 30 Characters. Ever.
+Answer with a JSON object with the key "triples".
+Example Input: Growth is in market is strong and continuous.
+Example Output: {{"triples": [["{slide_name}", "hasTitle", "Growth Analysis"], ["{slide_name}", "hasTopic", "Growth"], ["Growth", "hasStorypoint", "Continuous Growth"]]}}
+Example Input: Company Inshabinti is learning how to leverage inbound sales
+Example Output: {{"triples": [["{slide_name}", "hasTitle", "Inshabinti sales approach"], ["{slide_name}", "hasTopic", "Sales"], ["Sales", "hasStorypoint", "Changing Sales Approach"]]}}
+"""
+
+#one transaction per batch of slides. old title/topic links of a re-ingested slide are dropped before the new ones are merged.
+WRITE_SLIDES_QUERY = """
+            UNWIND $slides AS row
+            MERGE (deck:DECK {name: row.deck})
+            MERGE (slide:SLIDE {name: row.slide})
+            MERGE (deck)-[:hasSlide]->(slide)
+            FOREACH (old IN [(slide)-[link:hasTitle|hasTopic]->() | link] | DELETE old)
+            MERGE (title:TITLE {name: row.title})
+            SET title.number = row.number
+            MERGE (slide)-[:hasTitle]->(title)
+            MERGE (topic:TOPIC {name: row.topic})
+            MERGE (slide)-[:hasTopic]->(topic)
+            SET slide.updated_at = timestamp(), slide.content_hash = row.hash
+            WITH topic, row
+            UNWIND row.storypoints AS point
+            MERGE (storypoint:STORYPOINT {name: point})
+            MERGE (topic)-[:hasStorypoint]->(storypoint);
+            """
+
+#MERGE looks nodes up by name, so every label gets a uniqueness constraint (which comes with an index).
+CONSTRAINT_QUERIES = [f"CREATE CONSTRAINT {label.lower()}_name IF NOT EXISTS FOR (node:{label}) REQUIRE node.name IS UNIQUE"
+                      for label in ("DECK", "SLIDE", "TITLE", "TOPIC", "STORYPOINT")]
+
+
+## MANIFEST
+# ---------------------------------------------------------------------------------------------------------------------
+
+#what has been ingested so far: a number for every deck and the content hash and status of every slide.
+#it is only updated after the slides are in the graph, and written to disk after every batch.
+class Manifest:
+     def __init__(self, path):
+          self.path = path
+          self.decks = {}    #pdf file name -> {"number", "size", "mtime", "complete"}
+          self.slides = {}   #slide name -> {"hash", "status", "error"}
+          try:
+               with open(path, encoding="utf-8") as file:
+                    data = json.load(file)
+               self.decks, self.slides = data["decks"], data["slides"]
+          except (OSError, ValueError, KeyError):
+               pass
+
+     def deck_number(self, pdf_name):
+          deck = self.decks.get(pdf_name)
+          if deck is None:
+               number = max((deck["number"] for deck in self.decks.values()), default=-1) + 1
+               deck = self.decks[pdf_name] = {"number": number, "size": None, "mtime": None, "complete": False}
+          return deck["number"]
+
+     #a deck whose file hasn't changed since it was fully ingested doesn't even need to be opened.
+     def deck_unchanged(self, pdf_name, stat):
+          deck = self.decks.get(pdf_name)
+          return deck is not None and deck["complete"] and deck["size"] == stat.st_size and deck["mtime"] == stat.st_mtime
+
+     def slide_unchanged(self, slide_name, content_hash):
+          slide = self.slides.get(slide_name)
+          return slide is not None and slide["hash"] == content_hash and slide["status"] in ("done", "empty")
+
+     def save(self):
+          os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+          temp_path = f"{self.path}.tmp"
+          with open(temp_path, "w", encoding="utf-8") as file:
+               json.dump({"decks": self.decks, "slides": self.slides}, file)
+          os.replace(temp_path, self.path)
+
+
+## EXTRACTION
+# ---------------------------------------------------------------------------------------------------------------------
+
+#deck 1000 and page 10000 on just get longer numbers, slide_assets.SLIDE_ID reads those too.
+def deck_prefix(deck_number):
+     return f"deck_{deck_number:03d}_slide_"
+
+def slide_name(deck_number, page_number):
+     return f"{deck_prefix(deck_number)}{page_number:04d}"
+
+#a hash of what is on the page: its text and its drawing instructions, so layout and picture changes count too.
+def page_hash(page, text):
+     digest = hashlib.sha256(text.encode("utf-8"))
+     digest.update(page.read_contents() or b"")
+     return digest.hexdigest()
+
+def clean_name(name, storypoint=False):
+     name = " ".join(str(name).split())
+     if storypoint:
+          name = re.sub(r"[^0-9A-Za-z ]", "", name).strip()
+     return name[:MAX_NAME_LENGTH].strip()
+
+#checks the LLM answer and turns it into one title, one topic and one to three storypoints. raises ValueError if it doesn't fit.
+def parse_triples(answer):
+     triples = json.loads(answer)
+     if isinstance(triples, dict):
+          triples = triples.get("triples", triples.get("Knowledge Graph"))
+     if not isinstance(triples, list):
+          raise ValueError("no list of triples in the answer")
+
+     title, topic, storypoints = None, None, []
+     for triple in triples:
+          if not isinstance(triple, list) or len(triple) != 3 or triple[1] not in RELATIONS:
+               raise ValueError(f"not a valid triple: {triple}")
+          if triple[1] == "hasTitle":
+               title = title or clean_name(triple[2])
+          elif triple[1] == "hasTopic":
+               topic = topic or clean_name(triple[2])
+          else:
+               point = clean_name(triple[2], storypoint=True)
+               if point and point not in storypoints:
+                    storypoints.append(point)
+     if not topic or not storypoints:
+          raise ValueError("the answer has no topic or no storypoints")
+     return {"title": title or topic, "topic": topic, "storypoints": storypoints[:3]}
+
+#one LLM call per slide. an answer that doesn't validate is asked for once more.
+def extract_slide(name, text, model="gpt-3.5-turbo-1106", attempts=2):
+     with span("ingest.extract", slide=name):
+          for attempt in range(attempts):
+               response = get_client().complete(
+                    model = model,
+                    response_format = {"type": "json_object"},
+                    messages = [
+                    {"role": "system", "content": EXTRACTION_PROMPT.format(slide_name=name)},
+                    {"role": "user", "content": text}],
+                    temperature=0 if attempt == 0 else 0.3
+                    )
+               record_usage(response)
+               try:
+                    return parse_triples(response.choices[0].message.content)
+               except ValueError as error:
+                    last_error = error
+          raise last_error
+
+
+## PIPELINE
+# ---------------------------------------------------------------------------------------------------------------------
+
+#goes through the pages of one pdf lazily and yields (page number, text, content hash), rendering the png on the way.
+#pages that didn't change are skipped, and so is rendering a png that is already there.
+def iter_pages(pdf_path, deck_number, manifest, png_dir, zoom=2.0, force=False):
+     with fitz.open(pdf_path) as document:
+          for page in document:
+               number = page.number + 1
+               name = slide_name(deck_number, number)
+               text = page.get_text().strip()
+               content_hash = page_hash(page, text)
+               png_path = os.path.join(png_dir, f"{name}.png")
+               if not force and manifest.slide_unchanged(name, content_hash) and os.path.exists(png_path):
+                    continue
+               page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).save(png_path)
+               yield number, text, content_hash
+
+def find_pdfs(paths):
+     pdfs = []
+     for path in paths:
+          if os.path.isdir(path):
+               for folder, _, files in os.walk(path):
+                    pdfs += [os.path.join(folder, file) for file in sorted(files) if file.lower().endswith(".pdf")]
+          else:
+               pdfs.append(path)
+     return pdfs
+
+def write_batch(graph, batch, manifest):
+     if not batch:
+          return
+     with span("ingest.write", slides=len(batch)):
+          graph.query(WRITE_SLIDES_QUERY, params={"slides": batch})
+     for row in batch:
+          manifest.slides[row["slide"]] = {"hash": row["hash"], "status": "done", "error": None}
+     manifest.save()
+     batch.clear()
+
+def ingest(paths, graph, manifest, png_dir, max_workers=MAX_WORKERS, batch_size=50, zoom=2.0, force=False, model="gpt-3.5-turbo-1106"):
+     counts = {"decks": 0, "skipped_decks": 0, "slides": 0, "empty": 0, "failed": 0}
+     os.makedirs(png_dir, exist_ok=True)
+     batch = []
+     decks_seen = []
+
+     def finish(future):
+          row, name, content_hash = futures.pop(future)
+          try:
+               row.update(future.result())
+          except Exception as error:
+               print(f"Error: could not extract {name}: {error}")
+               manifest.slides[name] = {"hash": content_hash, "status": "failed", "error": str(error)}
+               counts["failed"] += 1
+               return
+          batch.append(row)
+          counts["slides"] += 1
+          if len(batch) >= batch_size:
+               write_batch(graph, batch, manifest)
+               print(f"Ingested {counts['slides']} slides...")
+
+     futures = {}
+     with ThreadPoolExecutor(max_workers=max_workers) as pool:
+          for pdf_path in find_pdfs(paths):
+               pdf_name = os.path.basename(pdf_path)
+               stat = os.stat(pdf_path)
+               if not force and manifest.deck_unchanged(pdf_name, stat):
+                    counts["skipped_decks"] += 1
+                    continue
+               deck_number = manifest.deck_number(pdf_name)
+               decks_seen.append((pdf_name, stat, deck_number))
+               counts["decks"] += 1
+
+               for number, text, content_hash in iter_pages(pdf_path, deck_number, manifest, png_dir, zoom, force):
+                    name = slide_name(deck_number, number)
+                    if not text:
+                         manifest.slides[name] = {"hash": content_hash, "status": "empty", "error": None}
+                         counts["empty"] += 1
+                         continue
+                    row = {"deck": os.path.splitext(pdf_name)[0], "slide": name, "number": number, "hash": content_hash}
+                    futures[pool.submit(extract_slide, name, text, model)] = (row, name, content_hash)
+                    #only a few pages are waiting at any time, so memory stays flat however big the library is.
+                    while len(futures) >= max_workers * 2:
+                         done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+                         for future in done:
+                              finish(future)
+
+          while futures:
+               done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+               for future in done:
+                    finish(future)
+     write_batch(graph, batch, manifest)
+
+     #a deck is complete when none of its pages failed. failed pages are tried again on the next run.
+     for pdf_name, stat, deck_number in decks_seen:
+          prefix = deck_prefix(deck_number)
+          failed = any(name.startswith(prefix) and slide["status"] == "failed" for name, slide in manifest.slides.items())
+          manifest.decks[pdf_name].update({"size": stat.st_size, "mtime": stat.st_mtime, "complete": not failed})
+     manifest.save()
+     return counts
+
+
+if __name__ == "__main__":
+     load_dotenv()
+     configure_tracing()
+     openai.api_key = os.getenv("OPENAI_API_KEY")
+
+     parser = argparse.ArgumentParser(description="Ingest pdf slide decks into the knowledge graph.")
+     parser.add_argument("paths", nargs="+", help="pdf files or folders with pdfs")
+     parser.add_argument("--png-dir", default=os.getenv("SLIDE_ASSET_ROOT") or "slides_png", help="where the slide pngs go")
+     parser.add_argument("--manifest", default=os.getenv("INGEST_MANIFEST") or ".slide_cache/ingest_manifest.json")
+     parser.add_argument("--workers", type=int, default=int(os.getenv("SLIDE_MAX_WORKERS") or MAX_WORKERS), help="slides extracted at the same time")
+     parser.add_argument("--batch-size", type=int, default=50, help="slides per neo4j transaction")
+     parser.add_argument("--zoom", type=float, default=2.0, help="png resolution, 1.0 is 72 dpi")
+     parser.add_argument("--model", default="gpt-3.5-turbo-1106")
+     parser.add_argument("--force", action="store_true", help="process every page, changed or not")
+     args = parser.parse_args()
+
+     if fitz is None:
+          sys.exit("PyMuPDF is needed to read pdfs: pip install pymupdf")
+     from langchain.graphs import Neo4jGraph
+     graph = Neo4jGraph(url=os.getenv("NEO4J_URL"), username=os.getenv("NEO4J_USERNAME"), password=os.getenv("NEO4J_PASSWORD"))
+     for query in CONSTRAINT_QUERIES:
+          try:
+               graph.query(query)
+          except Exception as error:
+               print(f"Error: could not create constraint ({error})")
+
+     started = time.time()
+     counts = ingest(args.paths, graph, Manifest(args.manifest), args.png_dir, args.workers, args.batch_size, args.zoom, args.force, args.model)
+     print(f"Done in {time.time() - started:.0f}s: {counts['slides']} slides from {counts['decks']} decks, "
+           f"{counts['skipped_decks']} unchanged decks skipped, {counts['empty']} empty and {counts['failed']} failed pages.")
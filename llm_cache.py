@@ -0,0 +1,124 @@
+# Importing the necessary Python libraries
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+#content-addressed key for one LLM call. the system prompt can be the whole graph, so only its hash goes into the key.
+def cache_key(model, temperature, system_prompt, user_prompt, **extra):
+     system_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+     parts = [model, temperature, system_hash, user_prompt, sorted(extra.items())]
+     return hashlib.sha256(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+
+## RESPONSE CACHE
+# ---------------------------------------------------------------------------------------------------------------------
+
+#two tier cache for LLM responses: a small in-memory LRU in front of a single sqlite file on disk.
+#entries expire after ttl seconds and the disk tier is trimmed to max_disk_items (least recently used go first).
+#entries that depend on the graph are tagged with the context version and are dropped when the context changes.
+class ResponseCache:
+     def __init__(self, path=".slide_cache/llm_cache.sqlite", max_memory_items=1024, max_disk_items=50000, ttl=7 * 24 * 3600):
+          self.path = path
+          self.max_memory_items = max_memory_items
+          self.max_disk_items = max_disk_items
+          self.ttl = ttl
+          self.context_version = None
+          self.memory = OrderedDict()
+          self.lock = threading.Lock()
+          self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+          if path != ":memory:":
+               os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+          #several UI worker processes can share the file (WAL mode), a writer waits for the others instead of failing.
+          self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+          self.db.execute("PRAGMA journal_mode=WAL")
+          self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                key TEXT PRIMARY KEY,
+                                value TEXT NOT NULL,
+                                context_version TEXT,
+                                created REAL NOT NULL,
+                                accessed REAL NOT NULL)""")
+          self.db.commit()
+
+     def get(self, key):
+          now = time.time()
+          with self.lock:
+               entry = self.memory.get(key)
+               if entry is not None and now - entry[1] < self.ttl:
+                    self.memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return entry[0]
+
+               row = self.db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+               if row is None or now - row[1] >= self.ttl:
+                    self.counters["misses"] += 1
+                    return None
+               self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+               self.db.commit()
+               self._remember(key, row[0], row[1])
+               self.counters["disk_hits"] += 1
+               return row[0]
+
+     #context_bound=True ties the entry to the current graph context (e.g. respond() prompts).
+     def set(self, key, value, context_bound=False):
+          now = time.time()
+          version = self.context_version if context_bound else None
+          with self.lock:
+               self._remember(key, value, now)
+               self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, value, version, now, now))
+               self.counters["writes"] += 1
+               if self.counters["writes"] % 100 == 0:
+                    self._evict(now)
+               self.db.commit()
+
+     #returns the cached value for key, or calls compute() once and stores its result.
+     def get_or_set(self, key, compute, context_bound=False):
+          value = self.get(key)
+          if value is None:
+               value = compute()
+               self.set(key, value, context_bound)
+          return value
+
+     #call this whenever the graph context is (re)loaded. answers that were based on an older context are thrown away.
+     def set_context_version(self, version):
+          with self.lock:
+               if version == self.context_version:
+                    return
+               self.context_version = version
+               self.memory.clear()
+               cursor = self.db.execute("DELETE FROM responses WHERE context_version IS NOT NULL AND context_version != ?", (version,))
+               self.counters["evictions"] += cursor.rowcount
+               self.db.commit()
+
+     def clear(self):
+          with self.lock:
+               self.memory.clear()
+               self.db.execute("DELETE FROM responses")
+               self.db.commit()
+
+     def stats(self):
+          with self.lock:
+               disk_items = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+               stats = dict(self.counters, memory_items=len(self.memory), disk_items=disk_items)
+          lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+          stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+          return stats
+
+     #the helpers below expect self.lock to be held.
+     def _remember(self, key, value, created):
+          self.memory[key] = (value, created)
+          self.memory.move_to_end(key)
+          while len(self.memory) > self.max_memory_items:
+               self.memory.popitem(last=False)
+
+     def _evict(self, now):
+          expired = self.db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+          overflow = self.db.execute("""DELETE FROM responses WHERE key IN (
+                                          SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)""",
+                                     (self.max_disk_items,)).rowcount
+          self.counters["evictions"] += expired + overflow
@@ -0,0 +1,276 @@
+# Importing the necessary Python libraries
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import Future
+from tracing import current_span
+
+#shared layer between the app and the openai API. every chat completion goes through it, so that many users at once
+#stay inside the provider limits instead of running into 429s:
+# - a token bucket for requests per minute and one for tokens per minute,
+# - a concurrency limit that grows while calls go well and halves on a 429 (AIMD),
+# - retries with jittered exponential backoff, all inside one deadline,
+# - identical prompts that are already in flight share one upstream call (singleflight).
+#the openai package takes about half a second to import, so that only happens with the first call.
+
+
+class LLMDeadlineExceeded(TimeoutError):
+     pass
+
+
+#rough token count for the tokens-per-minute bucket, ~4 characters per token.
+def estimate_tokens(messages, max_tokens=None):
+     return sum(len(message["content"]) for message in messages) // 4 + (max_tokens or 500)
+
+
+## LIMITERS
+# ---------------------------------------------------------------------------------------------------------------------
+
+#classic token bucket: holds up to `per_minute` tokens and refills continuously at that rate.
+class TokenBucket:
+     def __init__(self, per_minute):
+          self.capacity = float(per_minute)
+          self.rate = per_minute / 60.0
+          self.tokens = float(per_minute)
+          self.updated = time.monotonic()
+          self.lock = threading.Lock()
+
+     def _refill(self):
+          now = time.monotonic()
+          self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+          self.updated = now
+
+     #waits until `amount` tokens are available. raises LLMDeadlineExceeded if that would be after the deadline.
+     def acquire(self, amount, deadline=None):
+          amount = min(amount, self.capacity)
+          while True:
+               with self.lock:
+                    self._refill()
+                    if self.tokens >= amount:
+                         self.tokens -= amount
+                         return
+                    wait = (amount - self.tokens) / self.rate
+               if deadline is not None and time.monotonic() + wait > deadline:
+                    raise LLMDeadlineExceeded("rate limit would be exceeded before the deadline")
+               time.sleep(min(wait, 1.0))
+
+     #gives back what was taken too much, e.g. when a call used fewer tokens than estimated.
+     def refund(self, amount):
+          with self.lock:
+               self._refill()
+               self.tokens = min(self.capacity, self.tokens + amount)
+
+
+#a concurrency limit that adapts to what the provider tells us: additive increase while calls are fast and succeed,
+#multiplicative decrease on a 429 or when calls get slower than target_latency.
+class AdaptiveConcurrency:
+     def __init__(self, initial=4, minimum=1, maximum=16, target_latency=10.0):
+          self.limit = float(initial)
+          self.minimum = minimum
+          self.maximum = maximum
+          self.target_latency = target_latency
+          self.in_flight = 0
+          self.condition = threading.Condition()
+
+     def acquire(self, deadline=None):
+          with self.condition:
+               while self.in_flight >= int(self.limit):
+                    timeout = None if deadline is None else deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                         raise LLMDeadlineExceeded("no free slot before the deadline")
+                    self.condition.wait(timeout)
+               self.in_flight += 1
+
+     def release(self, latency=None, throttled=False):
+          with self.condition:
+               self.in_flight -= 1
+               if throttled:
+                    self.limit = max(self.minimum, self.limit / 2)
+               elif latency is not None and latency > self.target_latency:
+                    self.limit = max(self.minimum, self.limit - 1)
+               elif latency is not None:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+               self.condition.notify_all()
+
+
+#singleflight: the first caller for a key does the work, everybody asking for the same key meanwhile waits for that result.
+class SingleFlight:
+     def __init__(self):
+          self.lock = threading.Lock()
+          self.calls = {}
+
+     def do(self, key, func):
+          with self.lock:
+               future = self.calls.get(key)
+               leader = future is None
+               if leader:
+                    future = Future()
+                    self.calls[key] = future
+          if not leader:
+               current_span().set("coalesced", True)
+               return future.result()
+          try:
+               result = func()
+               future.set_result(result)
+               return result
+          except BaseException as error:
+               future.set_exception(error)
+               raise
+          finally:
+               with self.lock:
+                    self.calls.pop(key, None)
+
+
+## CLIENT
+# ---------------------------------------------------------------------------------------------------------------------
+
+class LLMClient:
+     def __init__(self, rpm=3500, tpm=160000, initial_concurrency=4, max_concurrency=16, target_latency=10.0,
+                  max_retries=5, base_backoff=0.5, max_backoff=20.0, deadline=60.0):
+          self.requests = TokenBucket(rpm)
+          self.tokens = TokenBucket(tpm)
+          self.concurrency = AdaptiveConcurrency(initial_concurrency, 1, max_concurrency, target_latency)
+          self.singleflight = SingleFlight()
+          self.max_retries = max_retries
+          self.base_backoff = base_backoff
+          self.max_backoff = max_backoff
+          self.deadline = deadline
+          self._client = None
+          self._client_lock = threading.Lock()
+
+     @classmethod
+     def from_env(cls):
+          return cls(rpm=int(os.getenv("LLM_RPM", 3500)),
+                     tpm=int(os.getenv("LLM_TPM", 160000)),
+                     initial_concurrency=int(os.getenv("LLM_INITIAL_CONCURRENCY", 4)),
+                     max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", 16)),
+                     target_latency=float(os.getenv("LLM_TARGET_LATENCY", 10)),
+                     max_retries=int(os.getenv("LLM_MAX_RETRIES", 5)),
+                     deadline=float(os.getenv("LLM_DEADLINE", 60)))
+
+     #our own openai client with its built-in retries switched off, the retries happen here.
+     #it is created on first use so it picks up openai.api_key / openai.base_url as the app set them.
+     def client(self):
+          import openai
+          with self._client_lock:
+               if self._client is None:
+                    self._client = openai.OpenAI(api_key=openai.api_key, base_url=openai.base_url, max_retries=0)
+               return self._client
+
+     #one chat completion, returns the openai response. `deadline` is the seconds the whole call may take, retries included.
+     #identical requests in flight are coalesced, except above temperature 0 where every caller should get an answer of its own.
+     def complete(self, model, messages, temperature=0, deadline=None, **options):
+          deadline_at = time.monotonic() + (deadline or self.deadline)
+          if temperature != 0:
+               return self._complete_with_retries(model, messages, temperature, deadline_at, options)
+          key = hashlib.sha256(json.dumps([model, messages, temperature, options], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+          return self.singleflight.do(key, lambda: self._complete_with_retries(model, messages, temperature, deadline_at, options))
+
+     def _complete_with_retries(self, model, messages, temperature, deadline_at, options):
+          import openai
+          estimate = estimate_tokens(messages, options.get("max_tokens"))
+          attempt = 0
+          while True:
+               self.requests.acquire(1, deadline_at)
+               self.tokens.acquire(estimate, deadline_at)
+               self.concurrency.acquire(deadline_at)
+               started = time.monotonic()
+               throttled = False
+               try:
+                    remaining = deadline_at - started
+                    response = self.client().chat.completions.create(model=model, messages=messages, temperature=temperature,
+                                                                     timeout=max(remaining, 0.1), **options)
+                    usage = getattr(response, "usage", None)
+                    if usage is not None and usage.total_tokens:
+                         self.tokens.refund(max(0, estimate - usage.total_tokens))
+                    return response
+               except openai.RateLimitError as error:
+                    throttled = True
+                    retry_after = self._retry_after(error)
+                    last_error = error
+               except (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError) as error:
+                    retry_after = None
+                    last_error = error
+               finally:
+                    self.concurrency.release(time.monotonic() - started, throttled)
+
+               attempt += 1
+               self._wait_before_retry(attempt, retry_after, deadline_at, last_error)
+
+     #streams one chat completion, yields the pieces of text as they arrive. same limits and slots as complete(), the
+     #slot is held until the stream is done or the caller stops reading. a failure before the first piece is retried,
+     #after it the error goes to the caller (the text it has would be repeated otherwise). never coalesced.
+     def stream(self, model, messages, temperature=0, deadline=None, **options):
+          import openai
+          deadline_at = time.monotonic() + (deadline or self.deadline)
+          estimate = estimate_tokens(messages, options.get("max_tokens"))
+          attempt = 0
+          while True:
+               self.requests.acquire(1, deadline_at)
+               self.tokens.acquire(estimate, deadline_at)
+               self.concurrency.acquire(deadline_at)
+               started = time.monotonic()
+               throttled = False
+               received = None
+               try:
+                    remaining = deadline_at - started
+                    chunks = self.client().chat.completions.create(model=model, messages=messages, temperature=temperature,
+                                                                   stream=True, timeout=max(remaining, 0.1), **options)
+                    for chunk in chunks:
+                         text = chunk.choices[0].delta.content if chunk.choices else None
+                         if text:
+                              if received is None:
+                                   received = time.monotonic()
+                                   current_span().set("first_token_ms", round((received - started) * 1000, 1))
+                              yield text
+                    return
+               except openai.RateLimitError as error:
+                    if received is not None:
+                         raise
+                    throttled = True
+                    retry_after = self._retry_after(error)
+                    last_error = error
+               except (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError) as error:
+                    if received is not None:
+                         raise
+                    retry_after = None
+                    last_error = error
+               finally:
+                    #the latency that counts for the concurrency limit is the wait for the first piece, a long answer isn't a slow server.
+                    self.concurrency.release((received or time.monotonic()) - started, throttled)
+
+               attempt += 1
+               self._wait_before_retry(attempt, retry_after, deadline_at, last_error)
+
+     #jittered exponential backoff, at least as long as the server asked for. gives up (raises the error) after
+     #max_retries attempts or when the wait would end past the deadline.
+     def _wait_before_retry(self, attempt, retry_after, deadline_at, error):
+          backoff = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+          backoff = max(backoff, retry_after or 0)
+          if attempt > self.max_retries or time.monotonic() + backoff >= deadline_at:
+               raise error
+          current_span().add("retries")
+          time.sleep(backoff)
+
+     @staticmethod
+     def _retry_after(error):
+          try:
+               return float(error.response.headers.get("retry-after"))
+          except (AttributeError, TypeError, ValueError):
+               return None
+
+
+#the client for the whole process, so every script and worker thread shares the same limits.
+#it is made on first use, after load_dotenv() has run.
+_shared_client = None
+_shared_lock = threading.Lock()
+
+def get_client():
+     global _shared_client
+     with _shared_lock:
+          if _shared_client is None:
+               _shared_client = LLMClient.from_env()
+          return _shared_client
@@ -1,148 +1,31 @@
 # Importing the necessary Python libraries
-import os
 from dotenv import load_dotenv
-import openai
-import langchain
-from langchain.chains import GraphCypherQAChain
-from langchain.chat_models import ChatOpenAI
-from langchain.graphs import Neo4jGraph
 import gradio as gr
-import re
-import json
+from slide_pipeline import SlidePipeline, slide_error
+from slide_assets import slide_id_in
+from tracing import traced, configure_tracing
+from fanout import iter_partial
+from ui_server import launch, run_starter, stop_runs, superseded, PAGING_EVENT, storyline_event, slides_event
 
-#setup Environment Variables and APIs
+#setup Environment Variables and APIs (the openai client reads OPENAI_API_KEY itself, when the first call is made)
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
-neo4j_url = os.getenv("NEO4J_URL")
-neo4j_username= os.getenv("NEO4J_USERNAME")
-neo4j_password= os.getenv("NEO4J_PASSWORD")
+configure_tracing()
 
-graph = Neo4jGraph(
-    url=neo4j_url, username=neo4j_username, password=neo4j_password)
+#the whole pipeline (context, caches, indexes, the LLM calls) lives in slide_pipeline.py, this file is only the UI on top of it.
+pipeline = SlidePipeline.from_env(asset_root='C:/path/to/slide/database/slides_png/')
+context_provider = pipeline.context
+asset_store = pipeline.assets
+slide_deck_storyline = pipeline.slide_deck_storyline
+respond = pipeline.respond
+process_list_AI = pipeline.process_list_AI
+process_list_batch = pipeline.process_list_batch
 
 
 ## HELPER FUNCTIONS
 # ---------------------------------------------------------------------------------------------------------------------
 
-#this function is a langchain wrapper to neo4j and it for a schema. In this case, the default parameter matches slides to storypoints.
-def context(graph_database, graph_database_schema="""
-            MATCH (slide:SLIDE)-[:hasTopic]->(topic:TOPIC)-[:hasStorypoint]->(storypoint:STORYPOINT)
-            RETURN slide.name AS SlideName, storypoint.name AS StorypointName;
-            """):
-     
-     graph = graph_database
-     schema = graph_database_schema
-     context = graph.query(schema)
-     return context
-
-#since we use the "context" as a default parameter in other functions to be more efficient, we will define it now.
-context = context(graph)
-
-#this function will be used to turn the chat output into a list of PATHs that we can use to find the slide png files.
-def png_path_finder(raw_text): #returns list of PATH strings
-        text = raw_text
-
-        try:
-            #find the base folder:
-            base_folder = 'C:/path/to/slide/database/slides_png/'
-            
-            # Use regular expression to find "deck" and extract the path            
-            deck_matches = re.findall(r'deck_(\d{3})_slide_(\d{4})', text)
-
-            # Construct the slide paths from the matches
-            file_paths = [f'{base_folder}deck_{deck}_slide_{slide}.png' for deck, slide in deck_matches]
-            
-            file_path = file_paths[0]
-            # Print the extracted file paths
-            return file_path
-        
-        #minor error handling:
-        except:
-             print("Error: probably no file passed through. Try again.")
-
-
-## MAIN FUNCTIONS
-# ---------------------------------------------------------------------------------------------------------------------
-
-#standard API Call to open AI with system prompt and user prompts.
-def chat(system_prompt, user_prompt, model="gpt-3.5-turbo-1106", temperature=0):
-    response = openai.chat.completions.create(
-        model = model,
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}],
-            temperature=temperature
-            )
-    res = response.choices[0].message.content
-      
-    return res
-
-#this function formats the user input and links it to the chat history for further context awareness.
-def format_chat_prompt(message, chat_history, max_convo_length):
-    prompt = ""
-    for turn in chat_history[-max_convo_length:]:
-        user_message, bot_message = turn
-        prompt = f"{prompt}\nUser: {user_message}\nAssistant: {bot_message}"
-    prompt = f"{prompt}\nUser: {message}\nAssistant:"
-    return prompt
-
-
-#this is where the magic happens. this function takes a query then runs it through the context of the knowledge graph, identying which slides have storypoints most related to the query topic. 
-#thus function returns a list of paths to the pngs of the slides so that gradio can search for those images and return them.
-def respond(message, context=context):
-        formatted_prompt = f"User:Please find slides related to {message}. Assistant:"
-        system_prompt=f"""
-        You have thes slides and storypoints as context: {context}
-        You are a machine that is incredibly wise and very considerate and smart at connecting the dots between scarce information.
-        Find the name of the slide with the storypoint that is most closely related to the message.
-        Before you decide take a deep breath and think about it. Be creative in how you abstract the connection between storypoint and the message.
-        Only answer with the slide name that you find in the context. Nothing else. No nicities, salutations or confirmations.
-        If you can't find one, try harder. Consider all slides. 
-        Only answer once you have considered every single slide.
-        Consider all decks and only return the slide name as formatted in the context: deck_000_slide_0000
-        """
-
-        bot_message = chat(system_prompt = system_prompt, user_prompt = formatted_prompt)
-        path = png_path_finder(bot_message)
-        print(bot_message)
-        return path
-
-#this is a simple prompt that takes a storyline prompt and formats an output in json to return a storyline of X slides.
-def slide_deck_storyline(storyline_prompt, nr_of_slides=5):
-     nr_of_slides = str(nr_of_slides)
-     system_prompt = f"""You are an AI particularly skilled at captivating storytelling for educational purposes.
-                        You know how tell a compelling, structure and exhaustive narrative around any given academic topic.
-                        What you are particularly good at, is taking any given input and building a storyline in the delivered as
-                        {nr_of_slides} slides and nothing else. This is your only chance to impress me.
-                        
-                        You will recieve a topic and you will answer with a list of {nr_of_slides} crucial slides.
-                        
-                        Instrucitions:
-                        Give me a json map of {nr_of_slides} slides that you would include in a slide deck about {storyline_prompt}.
-                        Only answer with the list. Do not include any nicities, greetings or repeat the task.
-                        Never make more than {nr_of_slides} slides. This is important!
-                        Just give me the list. Keep the list concise and only answer with the list in this format.
-                        Name every key a slide (Slide 1, Slide 2 ... Slide N).
-                        The elements of the list should be storypoints, highlighting what the point the slide is trying to make is.
-                        """
-
-     response = openai.chat.completions.create(
-            model = "gpt-3.5-turbo-1106", 
-            response_format = {"type": "json_object"},
-            messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": storyline_prompt}],
-            temperature=0
-            )
-     res = response.choices[0].message.content
-     map = json.loads(res)
-     pretty_list = "\n".join([f"⚡ {key}: {value}" for key, value in map.items()])
-     slide_name_list = [map[key] for key in map]
-     slide_name_nested = [slide_name_list]
-     return map, slide_name_nested, pretty_list
-
 #we need this function to turn the non iterable nested list that is gr.List into a simple list.
+@traced("ui.iterator_for_gr")
 def iterator_for_gr(nested_list, i):
      #Initialize a variable to store the processing result
      slide_names = []
@@ -152,24 +35,75 @@ def iterator_for_gr(nested_list, i):
          slide_names.append(item)
          
 
-     # Return a string that combines all the processed results
-     return str(slide_names[i-1])
-
-
-#we need this to go through the storyline and find the closest related slide for every topic.
-def process_list_AI(nested_list, context=context):
-     png_paths = [] #these are the paths to the pngs
-     slide_nicknames = [] #these are the names the slide_deck_storyline gave the slides.
-     nr = 0
-     items = str(len(nested_list[0]))
-     for i in nested_list[0]:
-        res = respond(i, context)
-        nr+=1
-        slide_nicknames.append("Slide "+ str(nr))
-        png_paths.append(res)
-        print(f"Completed ({nr}/{items}...)")
-     png_paths_nested = [png_paths]
-     return png_paths_nested, slide_nicknames
+     #the next few slides are rendered in the background, so paging through the storyline doesn't wait for them.
+     asset_store.prefetch(slide_id_in(name) for name in slide_names[int(i):int(i)+3] if name is not None)
+
+     # Return a string that combines all the processed results (slides that are not ready yet are None)
+     #matching hands out the original png when the preview wasn't rendered yet, by now it usually is.
+     slide = slide_names[int(i)-1]
+     if slide is None:
+          return None
+     slide_id = slide_id_in(slide)
+     return asset_store.quick_path(slide_id) if slide_id else str(slide)
+
+#when the user clicks a slide in the slide selector we show it and keep the slide number in sync.
+@traced("ui.select_slide")
+def select_slide(nested_list, index):
+     return iterator_for_gr(nested_list, index + 1), index + 1
+
+#labels for the slide selector: found slides get a tick, failed ones a cross and the ones still being worked on an hourglass.
+#found has True (found), False (failed) or None (still working) for every slide.
+def slide_choices(found):
+     return [f"Slide {nr} {'✅' if state else '⏳' if state is None else '❌'}" for nr, state in enumerate(found, start=1)]
+
+#"Found 3/5 slides...". failed slides are counted apart, with the reason the last one failed.
+def find_status(found, problems):
+     failed = [nr for nr, state in enumerate(found, start=1) if state is False]
+     status = f"Found {sum(1 for state in found if state)}/{len(found)} slides"
+     if failed:
+          status += f", none for slide {', '.join(str(nr) for nr in failed)} ({str(problems[failed[-1] - 1])[:200]})"
+     return status + ("..." if None in found else " ❌" if failed else " ✅")
+
+
+## MAIN FUNCTIONS
+# ---------------------------------------------------------------------------------------------------------------------
+
+#generator version of process_list_AI for the UI. gradio updates the outputs on every yield,
+#so each slide shows up in the image box and the slide selector as soon as it is found instead of after the whole storyline.
+#in batch mode the whole storyline is matched in one go (process_list_batch), so there is only one update.
+#when the user starts another run (run_id comes from run_starter) this one stops and drops the slides it hasn't started on.
+@traced("ui.find_slides")
+def process_list_AI_stream(nested_list, selected=1, batch=False, run_id=None, request: gr.Request = None, context=context_provider, max_workers=None):
+     storyline = nested_list[0]
+     found = [None] * len(storyline)
+     yield [[None] * len(storyline)], gr.Radio(choices=slide_choices(found), visible=True), None, f"Finding slides (0/{len(storyline)})..."
+
+     if batch:
+          png_paths_nested, slide_nicknames = process_list_batch(nested_list, context)
+          if superseded(request, run_id):
+               return
+          found = [png_path is not None for png_path in png_paths_nested[0]]
+          selected_position = min(max(int(selected or 1) - 1, 0), len(storyline) - 1)
+          shown = png_paths_nested[0][selected_position] if storyline else None
+          yield png_paths_nested, gr.Radio(choices=slide_choices(found), visible=True), shown, find_status(found, ["no slide found"] * len(storyline))
+          return
+
+     #respond() failing gives None (slide_error), we keep the error to show the user why.
+     problems = [None] * len(storyline)
+     def failed(position, error):
+          problems[position] = error
+          return slide_error(storyline[position], error)
+
+     for png_paths, position in iter_partial(lambda position: respond(storyline[position], context), range(len(storyline)), max_workers or pipeline.max_workers, on_error=failed):
+          if superseded(request, run_id):
+               return
+          found[position] = png_paths[position] is not None
+          if not found[position] and problems[position] is None:
+               problems[position] = "no slide found"
+          #keep showing the slide the user picked once it is found, otherwise show the one that just came in.
+          selected_position = int(selected or 1) - 1
+          shown = selected_position if 0 <= selected_position < len(storyline) and found[selected_position] else position
+          yield [png_paths], gr.Radio(choices=slide_choices(found), visible=True), png_paths[shown], find_status(found, problems)
      
 
 ## GRADIO UI LAYOUT & FUNCTIONALITY
@@ -194,15 +128,18 @@ with gr.Blocks(title='Slide Inspo', theme='Soft') as demo:
                gr.Markdown("# 2. Storyline: 🦄")
                             
                storyline_output_pretty = gr.Textbox(label="Your Storyline:", lines=13, scale=3)
+               batch_mode = gr.Checkbox(label="Match the whole storyline at once (distinct slides)", value=False)
                submit_button = gr.Button("⚡ Find Slides ⚡")
 
                btn.click(slide_deck_storyline, 
                                         inputs = [storyline_prompt, nr_slides_to_build], 
-                                        outputs = [storyline_output_JSON, storyline_output_slide_name_list, storyline_output_pretty])
+                                        outputs = [storyline_output_JSON, storyline_output_slide_name_list, storyline_output_pretty],
+                                        **storyline_event())
                 
                storyline_prompt.submit(slide_deck_storyline, 
                                         inputs = [storyline_prompt, nr_slides_to_build], 
-                                        outputs = [storyline_output_JSON, storyline_output_slide_name_list, storyline_output_pretty])
+                                        outputs = [storyline_output_JSON, storyline_output_slide_name_list, storyline_output_pretty],
+                                        **storyline_event())
 
           with gr.Column(scale=3):
                gr.Markdown("# 3. Output: ⚡⚡  ")
@@ -211,8 +148,10 @@ with gr.Blocks(title='Slide Inspo', theme='Soft') as demo:
 
                #now apply respond to everything in the list.
                pngs = gr.List(interactive=False, visible=False) #this is a list of png paths
-               nicknames = gr.Radio(type="index", visible=False)
+               nicknames = gr.Radio(type="index", visible=False, label="Slides:") #slide selector, filled in while the slides come in
+               progress_status = gr.Markdown() #shows how many slides are done
                image_box = gr.Image()
+               run_id = gr.State() #the latest run of this user, a new click (or clear) stops the one before
                clear = gr.ClearButton(components=[storyline_prompt, 
                                                           nr_slides_to_build, 
                                                           storyline_output_JSON,                                         
@@ -220,13 +159,22 @@ with gr.Blocks(title='Slide Inspo', theme='Soft') as demo:
                                                           storyline_output_pretty,
                                                           image_box,
                                                           see_slide,
+                                                          progress_status,
                                                           data, pngs, nicknames,
                                                           ],
 
                                                           value="🧨 Clear 🧨",
                                                           )
-               submit_button.click(process_list_AI, inputs=[data], outputs=[pngs, nicknames])
-               see_slide.input(iterator_for_gr, inputs=[pngs, see_slide], outputs=[image_box])
-
-gr.close_all()
-demo.launch(share=True)
+               #the LLM heavy run waits in the queue (the user sees their place in it), paging never does.
+               submit_button.click(run_starter("slides"), outputs=[run_id], **PAGING_EVENT).then(
+                    process_list_AI_stream, inputs=[data, see_slide, batch_mode, run_id], outputs=[pngs, nicknames, image_box, progress_status], **slides_event())
+               clear.click(stop_runs, **PAGING_EVENT)
+               see_slide.input(iterator_for_gr, inputs=[pngs, see_slide], outputs=[image_box], **PAGING_EVENT)
+               nicknames.input(select_slide, inputs=[pngs, nicknames], outputs=[image_box, see_slide], **PAGING_EVENT)
+
+#the UI only launches when the script is run directly, so the functions above can be imported.
+#it is up straight away: the context, indexes and the openai client load in the background, the first request waits for them if needed.
+#the queue, the limits per kind of event and the worker processes are set up in ui_server.py (UI_* in .env).
+if __name__ == "__main__":
+     gr.close_all()
+     launch(demo, pipeline.warm_up)
@@ -0,0 +1,225 @@
+# Importing the necessary Python libraries
+import os
+import re
+import sys
+import json
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fanout import map_ordered, MAX_WORKERS
+
+#the slide images as the UI should get them. the full resolution pngs stay where they are, next to them we keep smaller
+#pre-rendered versions (a thumbnail and a preview size, webp by default) that are a fraction of the bytes over a share link.
+#slide ids (deck_000_slide_0000) are looked up in an index of the png folder, not glued into a path.
+#without Pillow nothing is rendered and the original pngs are handed out as before.
+
+#deck numbers have at least 3 digits and page numbers at least 4, bigger libraries just get longer numbers (see ingest.slide_name).
+SLIDE_ID = re.compile(r"deck_\d{3,}_slide_\d{4,}")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+#name -> longest side in pixels.
+SIZES = {"thumb": 320, "preview": 1280}
+
+
+#Pillow is only imported when the first slide is rendered, None if it isn't installed.
+def pillow():
+     try:
+          from PIL import Image
+     except ImportError:
+          return None
+     return Image
+
+#the first slide id in a piece of text (an LLM answer, a file name...), or None.
+def slide_id_in(text):
+     match = SLIDE_ID.search(str(text or ""))
+     return match.group(0) if match else None
+
+
+class SlideAssetStore:
+     def __init__(self, root, cache_dir=".slide_cache/assets", sizes=SIZES, image_format="webp", quality=80,
+                  max_items=512, prefetch_workers=2):
+          self.root = root
+          self.cache_dir = cache_dir
+          self.sizes = dict(sizes)
+          self.image_format = image_format.lower()
+          self.quality = quality
+          self.max_items = max_items
+          self.index_path = os.path.join(cache_dir, "index.json")
+          self.sources = None
+          self.lock = threading.Lock()
+          self.render_locks = {}
+          #(slide id, size) -> path of the rendered file, least recently used first.
+          self.paths = OrderedDict()
+          self.prefetcher = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix="slide-prefetch")
+
+     @classmethod
+     def from_env(cls, root=None, cache_dir=None, image_format=None):
+          return cls(os.getenv("SLIDE_ASSET_ROOT") or root or "slides_png",
+                     cache_dir=cache_dir or os.getenv("SLIDE_ASSET_CACHE") or ".slide_cache/assets",
+                     image_format=image_format or os.getenv("SLIDE_ASSET_FORMAT") or "webp",
+                     max_items=int(os.getenv("SLIDE_ASSET_LRU_ITEMS", 512)))
+
+     ## INDEX
+     # ----------------------------------------------------------------------------------------------------------------
+
+     #slide id -> original file. read from index.json, or made by walking the root folder once.
+     def index(self):
+          with self.lock:
+               if self.sources is None:
+                    self.sources = self._read_index()
+                    if self.sources is None:
+                         self.sources = self._scan()
+                         self._write_index()
+               return self.sources
+
+     def rescan(self):
+          with self.lock:
+               self.sources = self._scan()
+               self.paths.clear()
+               self._write_index()
+          return self.sources
+
+     def _scan(self):
+          sources = {}
+          for folder, _, files in os.walk(self.root):
+               for file in sorted(files):
+                    slide_id = slide_id_in(file)
+                    if slide_id and file.lower().endswith(IMAGE_EXTENSIONS):
+                         #a png beats other formats of the same slide.
+                         if slide_id not in sources or file.lower().endswith(".png"):
+                              sources[slide_id] = os.path.join(folder, file)
+          return sources
+
+     def _read_index(self):
+          try:
+               with open(self.index_path, encoding="utf-8") as file:
+                    data = json.load(file)
+          except (OSError, ValueError):
+               return None
+          return data["sources"] if data.get("root") == self.root else None
+
+     def _write_index(self):
+          os.makedirs(self.cache_dir, exist_ok=True)
+          temporary = f"{self.index_path}.{os.getpid()}.tmp"
+          with open(temporary, "w", encoding="utf-8") as file:
+               json.dump({"root": self.root, "sources": self.sources}, file)
+          os.replace(temporary, self.index_path)
+
+     #the original file of a slide. slides added after the index was made are picked up from the usual file name.
+     def source(self, slide_id):
+          sources = self.index()
+          path = sources.get(slide_id)
+          if path is None:
+               path = os.path.join(self.root, f"{slide_id}.png")
+               if not os.path.exists(path):
+                    return None
+               with self.lock:
+                    sources[slide_id] = path
+          return path
+
+     ## RENDERING
+     # ----------------------------------------------------------------------------------------------------------------
+
+     def rendered_path(self, slide_id, size):
+          return os.path.join(self.cache_dir, size, f"{slide_id}.{self.image_format}")
+
+     #the file to show for a slide at the given size. renders it if it is missing or older than the original.
+     #falls back to the original when it can't be rendered. for slides without a file it gives the path the png would have.
+     def path(self, slide_id, size="preview"):
+          key = (slide_id, size)
+          with self.lock:
+               if key in self.paths:
+                    self.paths.move_to_end(key)
+                    return self.paths[key]
+
+          source = self.source(slide_id)
+          if source is None:
+               return os.path.join(self.root, f"{slide_id}.png")
+          path = self._render(slide_id, source, size) if size in self.sizes and pillow() is not None else source
+
+          with self.lock:
+               self.paths[key] = path
+               self.paths.move_to_end(key)
+               while len(self.paths) > self.max_items:
+                    self.paths.popitem(last=False)
+          return path
+
+     #like path(), but never waits for a render: a slide that isn't rendered yet gets its original file, and the rendering
+     #is queued in the background (see prefetch) so it is there the next time the slide is shown.
+     def quick_path(self, slide_id, size="preview"):
+          with self.lock:
+               if (slide_id, size) in self.paths:
+                    self.paths.move_to_end((slide_id, size))
+                    return self.paths[(slide_id, size)]
+          source = self.source(slide_id)
+          if source is None or size not in self.sizes or pillow() is None:
+               return self.path(slide_id, size)
+          target = self.rendered_path(slide_id, size)
+          try:
+               if os.path.getmtime(target) >= os.path.getmtime(source):
+                    return self.path(slide_id, size)
+          except OSError:
+               pass
+          self.prefetch([slide_id], size)
+          return source
+
+     def _render(self, slide_id, source, size):
+          Image = pillow()
+          target = self.rendered_path(slide_id, size)
+          with self.lock:
+               render_lock = self.render_locks.setdefault(target, threading.Lock())
+          #two users asking for the same slide at once only render it once.
+          with render_lock:
+               try:
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+                         return target
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with Image.open(source) as image:
+                         image.draft("RGB", (self.sizes[size], self.sizes[size]))
+                         image = image.convert("RGB")
+                         image.thumbnail((self.sizes[size], self.sizes[size]), Image.LANCZOS)
+                         temporary = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+                         image.save(temporary, format="JPEG" if self.image_format in ("jpg", "jpeg") else self.image_format.upper(),
+                                    quality=self.quality)
+                    os.replace(temporary, target)
+                    return target
+               except (OSError, ValueError, KeyError) as error:
+                    print(f"Error: could not render {size} of {slide_id}: {error}")
+                    return source
+
+     #renders the given slides in the background, e.g. the next slides of a storyline before the user pages to them.
+     def prefetch(self, slide_ids, size="preview"):
+          for slide_id in slide_ids:
+               if slide_id is not None:
+                    self.prefetcher.submit(self.path, slide_id, size)
+
+     #the batch job: renders every size of every slide in the index. returns how many files were written or checked.
+     def build_all(self, sizes=None, max_workers=MAX_WORKERS, progress=None):
+          jobs = [(slide_id, size) for slide_id in sorted(self.index()) for size in (sizes or self.sizes)]
+          map_ordered(lambda job: self.path(*job), jobs, max_workers, progress=progress)
+          return len(jobs)
+
+
+if __name__ == "__main__":
+     from dotenv import load_dotenv
+     load_dotenv()
+
+     parser = argparse.ArgumentParser(description="Pre-render slide thumbnails and previews.")
+     parser.add_argument("root", nargs="?", default=None, help="folder with the slide pngs, default SLIDE_ASSET_ROOT")
+     parser.add_argument("--cache-dir", default=None, help="default SLIDE_ASSET_CACHE")
+     parser.add_argument("--format", default=None, help="webp or jpeg, default SLIDE_ASSET_FORMAT")
+     parser.add_argument("--sizes", default=",".join(SIZES), help="comma separated, out of " + ", ".join(SIZES))
+     parser.add_argument("--workers", type=int, default=int(os.getenv("SLIDE_MAX_WORKERS") or MAX_WORKERS))
+     args = parser.parse_args()
+
+     if pillow() is None:
+          sys.exit("Pillow is needed to render slides: pip install pillow")
+     store = SlideAssetStore.from_env(root=args.root, cache_dir=args.cache_dir, image_format=args.format)
+     #a folder given on the command line wins over SLIDE_ASSET_ROOT.
+     if args.root:
+          store.root = args.root
+     store.rescan()
+     total = store.build_all(args.sizes.split(","), args.workers,
+                             progress=lambda done, items: print(f"\rRendered {done}/{items}", end="", flush=True))
+     print(f"\n{len(store.sources)} slides, {total} files in {store.cache_dir}")
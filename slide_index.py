@@ -0,0 +1,220 @@
+# Importing the necessary Python libraries
+import os
+import re
+import json
+import hashlib
+from functools import lru_cache
+import numpy as np
+from graph_context import context_fingerprint
+
+
+## EMBEDDERS
+# ---------------------------------------------------------------------------------------------------------------------
+
+#we hash every feature with blake2b instead of hash() so that the buckets stay the same across python runs.
+@lru_cache(maxsize=200000)
+def _bucket(feature, dim):
+     digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+     sign = 1.0 if digest >> 63 == 0 else -1.0
+     return digest % dim, sign
+
+#deterministic local embedder. it hashes words and character trigrams into a fixed size vector, so it works offline and costs nothing.
+class HashingEmbedder:
+     def __init__(self, dim=512):
+          self.dim = dim
+          self.name = f"hashing-{dim}"
+
+     def features(self, text):
+          words = re.findall(r"[a-z0-9]+", str(text).lower())
+          features = list(words)
+          for word in words:
+               padded = f"#{word}#"
+               features += [padded[i:i+3] for i in range(len(padded) - 2)]
+          return features
+
+     def embed(self, texts):
+          matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+          for row, text in enumerate(texts):
+               for feature in self.features(text):
+                    column, sign = _bucket(feature, self.dim)
+                    matrix[row, column] += sign
+          return normalize(matrix)
+
+#embedder that uses the openai embeddings endpoint. better quality, but needs the API key and network.
+class OpenAIEmbedder:
+     def __init__(self, model="text-embedding-ada-002", batch_size=1000):
+          self.model = model
+          self.batch_size = batch_size
+          self.name = f"openai-{model}"
+
+     def embed(self, texts):
+          import openai
+          vectors = []
+          for start in range(0, len(texts), self.batch_size):
+               response = openai.embeddings.create(model=self.model, input=list(texts[start:start + self.batch_size]))
+               vectors += [item.embedding for item in response.data]
+          return normalize(np.array(vectors, dtype=np.float32).reshape(len(texts), -1))
+
+#picks an embedder by name so the backend can be switched from the .env file (SLIDE_EMBEDDER=hashing or openai).
+def get_embedder(name=None):
+     name = name or os.getenv("SLIDE_EMBEDDER", "hashing")
+     if name == "openai":
+          return OpenAIEmbedder()
+     if name.startswith("hashing"):
+          dim = name.partition("-")[2]
+          return HashingEmbedder(int(dim)) if dim else HashingEmbedder()
+     raise ValueError(f"Unknown embedder: {name}")
+
+#cosine similarity is just a dot product once every row has length 1.
+def normalize(matrix):
+     norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+     norms[norms == 0] = 1.0
+     return matrix / norms
+
+
+## SLIDE INDEX
+# ---------------------------------------------------------------------------------------------------------------------
+
+#embedding index over the storypoints of the knowledge graph.
+#every unique storypoint is embedded once. a slide scores as well as its best storypoint.
+class SlideIndex:
+     def __init__(self, matrix, storypoints, slide_names, pair_storypoints, slide_offsets, embedder, fingerprint=None):
+          self.matrix = matrix                      #(unique storypoints x dim) float32 matrix
+          self.storypoints = storypoints            #text of every matrix row
+          self.slide_names = slide_names            #sorted slide names
+          self.pair_storypoints = pair_storypoints  #storypoint row of every slide/storypoint pair, grouped by slide
+          self.slide_offsets = slide_offsets        #where each slide's pairs start in pair_storypoints
+          self.embedder = embedder
+          self.fingerprint = fingerprint
+          self._position = None
+
+     def __len__(self):
+          return len(self.slide_names)
+
+     @classmethod
+     def build(cls, context, embedder=None):
+          embedder = embedder or get_embedder()
+          by_slide = {}
+          for row in context:
+               by_slide.setdefault(str(row["SlideName"]), []).append(str(row["StorypointName"]))
+
+          storypoints = sorted({storypoint for points in by_slide.values() for storypoint in points})
+          storypoint_row = {storypoint: i for i, storypoint in enumerate(storypoints)}
+          slide_names = sorted(by_slide)
+          pair_storypoints, slide_offsets = [], []
+          for name in slide_names:
+               slide_offsets.append(len(pair_storypoints))
+               pair_storypoints += sorted({storypoint_row[storypoint] for storypoint in by_slide[name]})
+
+          if storypoints:
+               matrix = embedder.embed(storypoints)
+          else:
+               matrix = np.zeros((0, getattr(embedder, "dim", 1)), dtype=np.float32)
+          return cls(matrix, storypoints, slide_names,
+                     np.array(pair_storypoints, dtype=np.int32), np.array(slide_offsets, dtype=np.int64),
+                     embedder, context_fingerprint(context))
+
+     #the matrix goes into path.npy, everything needed to map rows back to slides goes into the path.json sidecar.
+     #both are written to temp files and moved into place. the matrix file has a version in its name (the sidecar says which):
+     #load() memory maps it, and a mapped file can't be replaced on windows, so a new index never overwrites the old matrix.
+     def save(self, path):
+          os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+          temp_path = f"{path}.{os.getpid()}.tmp"
+          version = hashlib.sha256(f"{self.embedder.name} {self.fingerprint}".encode("utf-8")).hexdigest()[:16]
+          matrix_path = f"{path}.{version}.npy"
+          #the same version is the same matrix, it may already be there (and mapped by another process).
+          if not os.path.exists(matrix_path):
+               with open(temp_path, "wb") as file:
+                    np.save(file, self.matrix)
+               os.replace(temp_path, matrix_path)
+          sidecar = {"embedder": self.embedder.name,
+                     "matrix": os.path.basename(matrix_path),
+                     "fingerprint": self.fingerprint,
+                     "storypoints": self.storypoints,
+                     "slide_names": self.slide_names,
+                     "pair_storypoints": self.pair_storypoints.tolist(),
+                     "slide_offsets": self.slide_offsets.tolist()}
+          with open(temp_path, "w", encoding="utf-8") as file:
+               json.dump(sidecar, file)
+          os.replace(temp_path, f"{path}.json")
+
+          #older matrices go once nothing has them mapped anymore, the ones still in use are tried again on the next save.
+          folder, name = os.path.split(path)
+          for file_name in os.listdir(folder or "."):
+               if file_name.startswith(f"{name}.") and file_name.endswith(".npy") and file_name != sidecar["matrix"]:
+                    try:
+                         os.remove(os.path.join(folder, file_name))
+                    except OSError:
+                         pass
+
+     @classmethod
+     def load(cls, path, embedder=None):
+          with open(f"{path}.json", encoding="utf-8") as file:
+               sidecar = json.load(file)
+          embedder = embedder or get_embedder(sidecar["embedder"])
+          if embedder.name != sidecar["embedder"]:
+               raise ValueError(f"Index was built with {sidecar['embedder']}, not {embedder.name}")
+          matrix_path = os.path.join(os.path.dirname(path), sidecar["matrix"]) if "matrix" in sidecar else f"{path}.npy"
+          matrix = np.load(matrix_path, mmap_mode="r")
+          return cls(matrix, sidecar["storypoints"], sidecar["slide_names"],
+                     np.array(sidecar["pair_storypoints"], dtype=np.int32),
+                     np.array(sidecar["slide_offsets"], dtype=np.int64),
+                     embedder, sidecar.get("fingerprint"))
+
+     #scores every query against every slide in one go: a (queries x slides) matrix of cosine similarities.
+     def score_matrix(self, queries):
+          query_vectors = self.embedder.embed(list(queries))
+          storypoint_scores = self.matrix @ query_vectors.T
+          return np.maximum.reduceat(storypoint_scores[self.pair_storypoints], self.slide_offsets, axis=0).T
+
+     #returns the k best slides as (slide name, score) pairs, best first.
+     def search(self, query, k=5):
+          if len(self.slide_names) == 0:
+               return []
+          slide_scores = self.score_matrix([query])[0]
+
+          k = min(k, len(slide_scores))
+          top = np.argpartition(-slide_scores, k - 1)[:k]
+          top = top[np.argsort(-slide_scores[top], kind="stable")]
+          return [(self.slide_names[i], float(slide_scores[i])) for i in top]
+
+     #the union of the k best slides of every query, plus the (queries x those slides) part of the score matrix.
+     def candidates_for(self, queries, k=8):
+          if len(self.slide_names) == 0:
+               return [], np.zeros((len(queries), 0), dtype=np.float32)
+          scores = self.score_matrix(queries)
+          k = min(k, scores.shape[1])
+          top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+          columns = sorted(set(top.ravel().tolist()))
+          return [self.slide_names[column] for column in columns], scores[:, columns]
+
+     #turns slide names back into context rows (same shape as the graph query) so they can be handed to chat().
+     #names the index doesn't know (e.g. from an index built before the last refresh) are skipped.
+     def rows_for(self, slide_names):
+          if self._position is None:
+               self._position = {name: i for i, name in enumerate(self.slide_names)}
+          rows = []
+          for name in slide_names:
+               i = self._position.get(name)
+               if i is None:
+                    continue
+               end = self.slide_offsets[i + 1] if i + 1 < len(self.slide_offsets) else len(self.pair_storypoints)
+               for storypoint in self.pair_storypoints[self.slide_offsets[i]:end]:
+                    rows.append({"SlideName": name, "StorypointName": self.storypoints[storypoint]})
+          return rows
+
+
+#loads the saved index if it still matches the context, otherwise builds it again and saves it.
+def load_or_build_index(context, path, embedder=None):
+     embedder = embedder or get_embedder()
+     fingerprint = context_fingerprint(context)
+     try:
+          index = SlideIndex.load(path, embedder)
+          if index.fingerprint == fingerprint:
+               return index
+     except (OSError, ValueError, KeyError):
+          pass
+
+     index = SlideIndex.build(context, embedder)
+     index.save(path)
+     return index
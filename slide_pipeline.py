@@ -0,0 +1,534 @@
+# Importing the necessary Python libraries
+import os
+import re
+import json
+import time
+import importlib
+from graph_context import ContextProvider
+from context_format import encode_context, shard_rows
+from llm_cache import ResponseCache, cache_key
+from tracing import traced, span, current_span, record_usage
+from fanout import map_ordered, iter_streams, MAX_WORKERS
+from llm_client import get_client
+from slide_assets import SlideAssetStore, SLIDE_ID, slide_id_in
+
+#the slide pipeline without any UI: storyline -> matching slides -> html slides.
+#importing this module does nothing by itself (no .env, no neo4j, no files), everything is set up when a SlidePipeline is made.
+#it is also quick: numpy, scipy, openai and langchain are only imported when they are first needed (or by warm_up()).
+#the gradio apps (main.py, slidegeneratorTEST.py), cli.py and the benchmarks all use it:
+#
+#   from dotenv import load_dotenv
+#   load_dotenv()
+#   pipeline = SlidePipeline.from_env()
+#   storyline, nested, pretty = pipeline.slide_deck_storyline("Risk Management in Venture Capital", 5)
+#   png_paths_nested, nicknames = pipeline.process_list_AI(nested)
+
+
+#the graph is only connected to when the context is first needed, so the app can start while neo4j is down.
+def connect_graph():
+     from langchain.graphs import Neo4jGraph
+     return Neo4jGraph(url=os.getenv("NEO4J_URL"), username=os.getenv("NEO4J_USERNAME"), password=os.getenv("NEO4J_PASSWORD"))
+
+#if one slide fails we still want the rest of the storyline, so the failed slide just gets no png.
+def slide_error(storypoint, error):
+     print(f"Error: could not find a slide for '{storypoint}': {error}")
+     return None
+
+#a failed slide shows up as a small error message in the html box instead of breaking the whole deck.
+def html_error(storypoint, error):
+     print(f"Error: could not build the html slide for '{storypoint}': {error}")
+     return f"<p>Could not build this slide ({storypoint}). Try again.</p>"
+
+def slide_nicknames(storyline):
+     return ["Slide " + str(nr) for nr in range(1, len(storyline) + 1)] #these are the names the slide_deck_storyline gave the slides.
+
+
+class SlidePipeline:
+     def __init__(self, context, cache=None, assets=None, index_path=".slide_cache/slide_index", matcher="llm", llm_timeout=30,
+                  max_workers=MAX_WORKERS, shard_tokens=6000, shortlist=3, canonical="local"):
+          self.context = context          #a ContextProvider, or a plain list of SLIDE->TOPIC->STORYPOINT rows
+          self.cache = cache              #ResponseCache for temperature 0 answers, None to always ask the LLM
+          self.assets = assets or SlideAssetStore("slides_png")
+          self.index_path = index_path
+          self.matcher = matcher          #"llm" (candidates + LLM rerank), "index" (embedding index only), "bm25" (keyword index only)
+                                          #or "sharded" (the LLM ranks the whole library, shard by shard)
+          self.llm_timeout = llm_timeout  #seconds to wait for the LLM before respond() falls back to the local indexes
+          self.max_workers = max_workers
+          self.shard_tokens = shard_tokens  #tokens of context per prompt when the library is ranked in shards
+          self.shortlist = shortlist        #slides every shard passes on to the final pick
+          self.canonical = canonical        #where the canonical storypoints come from: "local", "graph" or "off" (see matching_rows)
+          if isinstance(context, ContextProvider):
+               self.watch_context(context)
+
+     #everything configured from the environment (see .env). call load_dotenv() first.
+     @classmethod
+     def from_env(cls, asset_root=None):
+          #the context (every SLIDE->TOPIC->STORYPOINT row) comes from a provider instead of a query at import time.
+          #it loads on first use from a local snapshot when there is one, and refreshes in the background every CONTEXT_REFRESH_INTERVAL seconds.
+          context = ContextProvider(connect_graph,
+                                    snapshot_path=os.getenv("CONTEXT_SNAPSHOT_PATH", ".slide_cache/context_snapshot.json"),
+                                    refresh_interval=float(os.getenv("CONTEXT_REFRESH_INTERVAL", 600)))
+          #chat() and slide_deck_storyline() run at temperature 0, so the same prompt gives the same answer. we keep those answers
+          #in memory and in a sqlite file so repeat queries cost nothing. answers based on the graph are dropped when the context changes.
+          cache = ResponseCache(os.getenv("LLM_CACHE_PATH", ".slide_cache/llm_cache.sqlite"),
+                                max_memory_items=int(os.getenv("LLM_CACHE_MEMORY_ITEMS", 1024)),
+                                max_disk_items=int(os.getenv("LLM_CACHE_DISK_ITEMS", 50000)),
+                                ttl=float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600)))
+          #the slide images: ids are looked up in an index of SLIDE_ASSET_ROOT and the UI gets small pre-rendered previews instead of the full pngs.
+          assets = SlideAssetStore.from_env(root=asset_root)
+          return cls(context, cache, assets,
+                     index_path=os.getenv("SLIDE_INDEX_PATH", ".slide_cache/slide_index"),
+                     matcher=os.getenv("SLIDE_MATCHER", "llm"),
+                     llm_timeout=float(os.getenv("LLM_TIMEOUT", 30)),
+                     max_workers=int(os.getenv("SLIDE_MAX_WORKERS") or MAX_WORKERS),
+                     shard_tokens=int(os.getenv("SLIDE_SHARD_TOKENS") or 6000),
+                     canonical=os.getenv("SLIDE_CANONICAL") or "local")
+
+     ## CONTEXT & INDEXES
+     # ----------------------------------------------------------------------------------------------------------------
+
+     #the rows matching works on: near duplicate storypoints replaced by their canonical storypoint (see canonical.py), so the
+     #indexes and prompts search far fewer storypoints and every hit expands to all the slides behind it.
+     #"local" clusters the storypoints here (saved next to the slide index and updated when the context changes), "graph" uses
+     #the canonicalAs links that `python canonical.py` wrote, "off" matches the storypoints as they are.
+     #a plain list of rows is used as it is.
+     def matching_rows(self, context):
+          if not isinstance(context, ContextProvider):
+               return context
+          if self.canonical == "off":
+               return context.rows()
+          return context.derive("canonical_rows", lambda rows: self.build_canonical_rows(rows, context))
+
+     def build_canonical_rows(self, rows, provider):
+          from canonical import canonicalize_rows, canonical_rows, load_or_build_canonical, read_canonical_links
+          with span("canonical_rows", rows=len(rows), source=self.canonical):
+               mapping = None
+               if self.canonical == "graph":
+                    try:
+                         #storypoints the links don't cover yet are clustered against the canonical storypoints in the graph.
+                         links = read_canonical_links(provider.graph())
+                         mapping = canonicalize_rows(rows, known=links) if links else None
+                    except Exception as error:
+                         print(f"Error: could not read the canonical storypoints from the graph ({error}), clustering them here instead.")
+               if mapping is None:
+                    mapping = load_or_build_canonical(rows, f"{self.index_path}_canonical")
+               return canonical_rows(rows, mapping)
+
+     #the storypoint embedding index is built from the context and saved to disk. it is only rebuilt when the graph changes.
+     #respond() uses it to pick a few candidate slides instead of putting the whole graph into the prompt.
+     def build_slide_index(self, rows):
+          from slide_index import load_or_build_index
+          return load_or_build_index(rows, self.index_path)
+
+     def slide_index(self, provider):
+          return provider.derive("slide_index", lambda rows: self.build_slide_index(self.matching_rows(provider)))
+
+     #keyword (BM25) index over slide names, topics and storypoints. it needs no network, so respond() can always fall back to it.
+     #it is updated slide by slide when the context changes instead of being rebuilt.
+     def keyword_index(self, provider):
+          from bm25_index import BM25Index
+          return provider.derive("bm25", lambda rows: BM25Index.from_rows(self.matching_rows(provider)),
+                                 lambda index, rows: index.sync(self.matching_rows(provider)))
+
+     #the library in shards that each fit into one prompt (shard_tokens of compact context), split by deck.
+     def context_shards(self, context):
+          if isinstance(context, ContextProvider):
+               return context.derive(f"shards_{self.shard_tokens}", lambda rows: shard_rows(self.matching_rows(context), self.shard_tokens))
+          return shard_rows(context, self.shard_tokens)
+
+     #when the context of a provider changes, old cached answers are dropped and the indexes are brought up to date straight away (in the refresh thread).
+     def watch_context(self, provider):
+          def on_context_change(rows, version):
+               if self.cache is not None:
+                    self.cache.set_context_version(version)
+               self.keyword_index(provider)
+               self.slide_index(provider)
+          provider.subscribe(on_context_change)
+
+     #loads everything the first request would otherwise wait for: the python packages, the context and the indexes built
+     #from it, and the openai client. the apps run it in a background thread while the UI is already up.
+     def warm_up(self):
+          started = time.perf_counter()
+          #the assignment module brings numpy and scipy (batch mode) with it.
+          steps = [self.assets.index, get_client().client, lambda: importlib.import_module("assignment")]
+          if isinstance(self.context, ContextProvider):
+               steps = [self.context.rows, lambda: self.matching_rows(self.context), lambda: self.keyword_index(self.context),
+                        lambda: self.slide_index(self.context)] + steps
+               if self.matcher == "sharded":
+                    steps.insert(2, lambda: self.context_shards(self.context))
+          ready = True
+          for step in steps:
+               try:
+                    step()
+               except Exception as error:
+                    print(f"Error: warm up step failed, the first request will try again: {error}")
+                    ready = False
+          print(f"Backends {'ready' if ready else 'partly ready'} after {time.perf_counter() - started:.1f}s")
+          return ready
+
+     ## LLM
+     # ----------------------------------------------------------------------------------------------------------------
+
+     #standard API Call to open AI with system prompt and user prompts.
+     #only answers at temperature 0 are cached, anything higher is meant to come out different every time.
+     #json_mode=True asks the model for a json object (response_format), the answer is still returned as text.
+     #calls go through the shared llm_client, which keeps us inside the rate limits, retries and coalesces identical prompts.
+     def chat(self, system_prompt, user_prompt, model="gpt-3.5-turbo-1106", temperature=0, json_mode=False, timeout=None):
+          options = {"response_format": {"type": "json_object"}} if json_mode else {}
+
+          def call():
+               current.set("cache_hit", False)
+               response = get_client().complete(
+                    model = model,
+                    messages = [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}],
+                    temperature=temperature,
+                    deadline=timeout,
+                    **options
+                    )
+               record_usage(response)
+               return response.choices[0].message.content
+
+          #the span records the model, whether the cache answered, and the token usage of the openai response.
+          with span("chat", model=model, temperature=temperature) as current:
+               if self.cache is None or temperature != 0:
+                    return call()
+               current.set("cache_hit", True)
+               return self.cache.get_or_set(cache_key(model, temperature, system_prompt, user_prompt, json_mode=json_mode), call, context_bound=True)
+
+     ## STORYLINE
+     # ----------------------------------------------------------------------------------------------------------------
+
+     #this is a simple prompt that takes a storyline prompt and formats an output in json to return a storyline of X slides.
+     @traced("slide_deck_storyline")
+     def slide_deck_storyline(self, storyline_prompt, nr_of_slides=5):
+          nr_of_slides = str(nr_of_slides)
+          system_prompt = f"""You are an AI particularly skilled at captivating storytelling for educational purposes.
+                        You know how tell a compelling, structure and exhaustive narrative around any given academic topic.
+                        What you are particularly good at, is taking any given input and building a storyline in the delivered as
+                        {nr_of_slides} slides and nothing else. This is your only chance to impress me.
+
+                        You will recieve a topic and you will answer with a list of {nr_of_slides} crucial slides.
+
+                        Instrucitions:
+                        Give me a json map of {nr_of_slides} slides that you would include in a slide deck about {storyline_prompt}.
+                        Only answer with the list. Do not include any nicities, greetings or repeat the task.
+                        Never make more than {nr_of_slides} slides. This is important!
+                        Just give me the list. Keep the list concise and only answer with the list in this format.
+                        Name every key a slide (Slide 1, Slide 2 ... Slide N).
+                        The elements of the list should be storypoints, highlighting what the point the slide is trying to make is.
+                        """
+
+          def call():
+               current_span().set("cache_hit", False)
+               response = get_client().complete(
+                    model = "gpt-3.5-turbo-1106",
+                    response_format = {"type": "json_object"},
+                    messages = [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": storyline_prompt}],
+                    temperature=0
+                    )
+               record_usage(response)
+               return response.choices[0].message.content
+
+          #the storyline does not depend on the graph, so it stays cached when the context changes.
+          if self.cache is None:
+               res = call()
+          else:
+               key = cache_key("gpt-3.5-turbo-1106", 0, system_prompt, storyline_prompt, response_format="json_object")
+               current_span().set("cache_hit", True)
+               res = self.cache.get_or_set(key, call)
+          with span("storyline.json_parse"):
+               map = json.loads(res)
+          pretty_list = "\n".join([f"⚡ {key}: {value}" for key, value in map.items()])
+          slide_name_list = [map[key] for key in map]
+          slide_name_nested = [slide_name_list]
+          return map, slide_name_nested, pretty_list
+
+     ## SLIDE MATCHING
+     # ----------------------------------------------------------------------------------------------------------------
+
+     #this function will be used to turn the chat output into the PATH of the slide image that the UI shows (the preview size).
+     @traced("png_path_finder")
+     def png_path_finder(self, raw_text, size="preview"): #returns a PATH string
+          # Use regular expression to find "deck" and look the slide up in the asset store
+          #matching doesn't wait for the preview to be rendered, the original is handed out until the preview is there.
+          slide_id = slide_id_in(raw_text)
+          file_path = self.assets.quick_path(slide_id, size) if slide_id else None
+
+          #minor error handling:
+          if file_path is None:
+               print("Error: probably no file passed through. Try again.")
+          return file_path
+
+     #this is where the magic happens. this function takes a query then runs it through the context of the knowledge graph, identying which slides have storypoints most related to the query topic.
+     #thus function returns a list of paths to the pngs of the slides so that gradio can search for those images and return them.
+     #with an index, only the top_k candidate slides go to the LLM for a final rerank. with rerank=False the best match is returned straight away.
+     #the candidates are the top_k of the embedding index plus the top_k of the BM25 keyword index (the prefilter).
+     #matcher="bm25" skips the LLM and the embeddings altogether. if the LLM times out or fails, the best local match is returned instead.
+     #matcher="sharded" lets the LLM rank the whole library in token-budgeted shards (see rank_sharded), for libraries too big for one prompt.
+     #context can be a provider or a plain list of rows, by default it is the pipeline's.
+     @traced("respond")
+     def respond(self, message, context=None, index=None, top_k=8, rerank=True, matcher=None, keywords=None, timeout=None):
+          from bm25_index import BM25Index
+          context = self.context if context is None else context
+          matcher = matcher or self.matcher
+          timeout = timeout or self.llm_timeout
+          provider = context if isinstance(context, ContextProvider) else None
+          if provider is not None:
+               context = self.matching_rows(provider)
+               keywords = keywords or self.keyword_index(provider)
+          else:
+               keywords = keywords or BM25Index.from_rows(context)
+          current_span().set("matcher", matcher)
+          with span("respond.keyword_search"):
+               keyword_candidates = keywords.search(message, k=top_k)
+          if matcher == "bm25":
+               return self.png_path_finder(keyword_candidates[0][0]) if keyword_candidates else None
+          if matcher == "sharded":
+               slide_name = self.rank_sharded(message, self.context_shards(provider or context), timeout=timeout)
+               slide_name = slide_name or (keyword_candidates[0][0] if keyword_candidates else None)
+               return self.png_path_finder(slide_name) if slide_name else None
+
+          if provider is not None:
+               index = index or self.slide_index(provider)
+          with span("respond.index_search"):
+               candidates = index.search(message, k=top_k) if index is not None and len(index) > 0 else []
+          #best local guess: the embedding match, or the keyword match when there is no index.
+          fallback = (candidates or keyword_candidates or [(None, 0)])[0][0]
+          if matcher == "index" or (candidates and not rerank):
+               return self.png_path_finder(fallback) if fallback else None
+
+          with span("respond.prompt") as current:
+               compact = None
+               if candidates or keyword_candidates:
+                    slide_names = list(dict.fromkeys(slide_name for slide_name, score in candidates + keyword_candidates))
+                    prompt_rows = index.rows_for(slide_names) if candidates else []
+                    #keyword matches the slide index doesn't have (the indexes are derived separately) come from the context.
+                    missing = set(slide_names) - {row["SlideName"] for row in prompt_rows}
+                    if missing:
+                         prompt_rows += [row for row in context if row["SlideName"] in missing]
+                    compact = encode_context(prompt_rows)
+               else:
+                    shards = self.context_shards(provider or context)
+                    if len(shards) <= 1 and provider is not None:
+                         compact = provider.derive("compact_context", lambda rows: encode_context(self.matching_rows(provider)))
+                    elif len(shards) <= 1:
+                         compact = encode_context(context)
+               current.set("slides", len(compact.aliases) if compact is not None else None)
+
+          #no candidates and the whole library doesn't fit into one prompt, so it is ranked shard by shard.
+          if compact is None:
+               slide_name = self.rank_sharded(message, shards, timeout=timeout)
+               return self.png_path_finder(slide_name) if slide_name else None
+
+          try:
+               bot_message = self.pick_slide(message, compact, timeout)
+          except Exception as error:
+               print(f"Error: the LLM did not answer ({error}), using the best local match instead.")
+               current_span().set("fallback", True)
+               return self.png_path_finder(fallback) if fallback else None
+          print(bot_message)
+
+          #map the id back to the deck_000_slide_0000 name. if the LLM answered with the full name anyway, png_path_finder still finds it.
+          with span("respond.extract"):
+               slide_name = compact.resolve(bot_message)
+               if slide_name is None and not SLIDE_ID.search(bot_message or "") and fallback:
+                    slide_name = fallback
+          return self.png_path_finder(slide_name or bot_message)
+
+     #asks the LLM for the one slide out of compact (a CompactContext) that fits the message best. returns its answer, the slide id.
+     def pick_slide(self, message, compact, timeout=None):
+          #the context goes into the prompt in the compact format (see context_format.py), so the LLM answers with a short slide id.
+          formatted_prompt = f"User:Please find slides related to {message}. Assistant:"
+          system_prompt=f"""
+        You have thes slides and storypoints as context:
+        {compact.text}
+        You are a machine that is incredibly wise and very considerate and smart at connecting the dots between scarce information.
+        Find the id of the slide with the storypoint that is most closely related to the message.
+        Before you decide take a deep breath and think about it. Be creative in how you abstract the connection between storypoint and the message.
+        Only answer with the slide id that you find in the context. Nothing else. No nicities, salutations or confirmations.
+        If you can't find one, try harder. Consider all slides.
+        Only answer once you have considered every single slide.
+        Consider all decks and only return the slide id as formatted in the context: s1
+        """
+          return self.chat(system_prompt = system_prompt, user_prompt = formatted_prompt, timeout = timeout)
+
+     #map-reduce ranking for libraries that don't fit into one prompt. every shard (see context_shards) gives its best
+     #`shortlist` slides, all shards at the same time, so it takes about as long as one shard. then pick_slide() chooses
+     #the winner out of the shortlisted slides. returns the slide name, or None if no shard came back with anything.
+     @traced("rank_sharded")
+     def rank_sharded(self, message, shards, shortlist=None, timeout=None):
+          shortlist = shortlist or self.shortlist
+          timeout = timeout or self.llm_timeout
+          formatted_prompt = f"User:Please find slides related to {message}. Assistant:"
+          current_span().set("shards", len(shards))
+
+          def rank(shard):
+               compact = encode_context(shard)
+               system_prompt = f"""
+        You have these slides and storypoints as context:
+        {compact.text}
+        Find the ids of the {shortlist} slides with the storypoints that are most closely related to the message, the best one first.
+        Be creative in how you abstract the connection between storypoint and the message.
+        Only answer with the slide ids as formatted in the context, separated by spaces: s1 s2
+        No nicities, salutations or confirmations.
+        """
+               answer = self.chat(system_prompt=system_prompt, user_prompt=formatted_prompt, timeout=timeout)
+               aliases = [alias for alias in dict.fromkeys(re.findall(r"\bs\d+\b", answer or "")) if alias in compact.aliases]
+               return [compact.aliases[alias] for alias in aliases[:shortlist]]
+
+          def rank_error(shard, error):
+               print(f"Error: could not rank a shard of {len(shard)} rows: {error}")
+               return []
+
+          with span("rank_sharded.map"):
+               shortlisted = map_ordered(rank, shards, self.max_workers, on_error=rank_error)
+          slide_names = list(dict.fromkeys(name for names in shortlisted for name in names))
+          current_span().set("shortlisted", len(slide_names))
+          if len(slide_names) <= 1:
+               return slide_names[0] if slide_names else None
+
+          with span("rank_sharded.reduce"):
+               wanted = set(slide_names)
+               compact = encode_context([row for shard in shards for row in shard if row["SlideName"] in wanted])
+               try:
+                    return compact.resolve(self.pick_slide(message, compact, timeout)) or slide_names[0]
+               except Exception as error:
+                    print(f"Error: the final pick failed ({error}), using the first shortlisted slide instead.")
+                    return slide_names[0]
+
+     #we need this to go through the storyline and find the closest related slide for every topic.
+     #the storypoints are matched concurrently (at most max_workers at a time), but the results keep the storyline order.
+     @traced("process_list_AI")
+     def process_list_AI(self, nested_list, context=None, max_workers=None):
+          storyline = nested_list[0]
+          png_paths = map_ordered(lambda storypoint: self.respond(storypoint, context), storyline, max_workers or self.max_workers,
+                                  on_error=slide_error,
+                                  progress=lambda nr, items: print(f"Completed ({nr}/{items}...)"))
+          png_paths_nested = [png_paths] #these are the paths to the pngs
+          return png_paths_nested, slide_nicknames(storyline)
+
+     #one structured call that scores every storyline point against every candidate slide (0 to 10).
+     #returns a (storyline points x candidates) matrix, slides the model leaves out score 0.
+     def score_storyline(self, storyline, candidate_rows):
+          import numpy as np
+          compact = encode_context(candidate_rows)
+          slide_ids = {name: alias for alias, name in compact.aliases.items()}
+          points = "\n".join(f"{nr} {storypoint}" for nr, storypoint in enumerate(storyline, start=1))
+          system_prompt = f"""
+     You have these slides and storypoints as context:
+     {compact.text}
+     You will get a numbered storyline. For every storyline point, score how well each slide fits that point from 0 to 10.
+     Be creative in how you abstract the connection between storypoint and the storyline point.
+     Answer with a json map: the key is the storyline point number, the value is a json map of slide id to score.
+     Only include slides with a score above 0. No nicities, salutations or confirmations.
+     """
+          answer = json.loads(self.chat(system_prompt=system_prompt, user_prompt=points, json_mode=True))
+
+          names = list(dict.fromkeys(row["SlideName"] for row in candidate_rows))
+          scores = np.zeros((len(storyline), len(names)))
+          for column, name in enumerate(names):
+               for nr in range(1, len(storyline) + 1):
+                    scores[nr - 1, column] = float((answer.get(str(nr)) or {}).get(slide_ids[name], 0))
+          return scores
+
+     #batch mode: match the whole storyline at once and solve the assignment globally, so two points don't end up on the same slide.
+     #the candidates come from the slide index (top_k per point). with use_llm the scores come from one score_storyline() call,
+     #otherwise (or if that call fails) the local similarity matrix is used as is.
+     @traced("process_list_batch")
+     def process_list_batch(self, nested_list, context=None, top_k=8, use_llm=True, method="hungarian"):
+          from assignment import assign_slides
+          context = self.context if context is None else context
+          storyline = nested_list[0]
+          index = self.slide_index(context) if isinstance(context, ContextProvider) else self.build_slide_index(context)
+          candidate_names, scores = index.candidates_for(storyline, k=top_k)
+          if use_llm and candidate_names:
+               try:
+                    #the local score breaks ties between slides the LLM scored the same.
+                    scores = self.score_storyline(storyline, index.rows_for(candidate_names)) + 0.1 * scores
+               except Exception as error:
+                    print(f"Error: batch scoring failed, using the local scores instead: {error}")
+
+          assignment = assign_slides(scores, method=method)
+          png_paths = map_ordered(lambda slide: self.png_path_finder(candidate_names[slide]) if slide is not None else None, assignment)
+          return [png_paths], slide_nicknames(storyline)
+
+     ## HTML SLIDES
+     # ----------------------------------------------------------------------------------------------------------------
+
+     #create HTML versions of the slides (with bullet points)
+     #streams the slide: yields the html received so far every time a piece arrives, the last value is the whole slide.
+     #finished slides are kept per storypoint, so asking for the same slide again gives the stored one right away.
+     #regenerate=True asks the model for a new version and replaces the stored one (that's the "regenerate slide" button).
+     @traced("html_maker")
+     def html_maker_stream(self, message, temperature=1, regenerate=False, model="gpt-3.5-turbo-1106"):
+          formatted_prompt = f"User: Please create the HTML for slides related to {message}. only return the HTML code. HTML:"
+
+          system_prompt3 = f"""Only answer in html. Nothing else. Give me the html code to for a slide on a 640x360 canvas.
+        The topic of the slide is {message}.
+        I want the slide to be a pretty gradient colour and have a catchy action title and 3 bullet points on the left half
+        and in right half of the slide include a  large emoji that represents the slide.
+        the style.body ALWAYs needs to be left blank. it is the style.slide that needs the pretty colourful gradient.
+        Also Add a footnote with tips on what kind visual communication device such as chart, graphs or images would be
+        best to drive home the point this slide is trying to make.
+        Always make sure there is enough contrast between the slide colour and the text, better safe than sorry.
+        Only respond with html no nicities or explanations.
+        Make sure the slide looks nice and balanced.
+        Everytime the slide is exceptionally beautiful you will be tipped 200$.
+        Make sure it all fits into the slide, especially the text. Avoid making it too big.
+        Make sure there are no back ground colours that change the background of the browser window."""
+
+          key = cache_key(model, temperature, system_prompt3, formatted_prompt, kind="html_slide")
+          if self.cache is not None and not regenerate:
+               bot_message = self.cache.get(key)
+               current_span().set("cache_hit", bot_message is not None)
+               if bot_message is not None:
+                    yield bot_message
+                    return
+
+          bot_message = ""
+          for text in get_client().stream(
+               model = model,
+               messages = [
+               {"role": "system", "content": system_prompt3},
+               {"role": "user", "content": formatted_prompt}],
+               temperature=temperature,
+               deadline=self.llm_timeout * 2):
+               bot_message += text
+               yield bot_message
+          if not bot_message:
+               raise ValueError("the model sent an empty slide")
+          #only a slide that came through completely is kept, a stream that broke off is not.
+          if self.cache is not None:
+               self.cache.set(key, bot_message)
+
+     #the whole slide at once.
+     def html_maker(self, message, temperature=1, regenerate=False):
+          bot_message = None
+          for bot_message in self.html_maker_stream(message, temperature, regenerate):
+               pass
+          return bot_message
+
+     #all slides of a storyline at the same time (at most max_workers), yields (html so far for every slide, position, done)
+     #whenever a piece of any slide arrives. unstarted slides are None, a failed slide gets the html_error message.
+     def html_AI_progress(self, nested_list, max_workers=None, regenerate=False):
+          storyline = nested_list[0]
+          html_code = [None] * len(storyline)
+          for position, html, done in iter_streams(lambda storypoint: self.html_maker_stream(storypoint, regenerate=regenerate),
+                                                   storyline, max_workers or self.max_workers, on_error=html_error):
+               html_code[position] = html
+               yield html_code, position, done
+
+     #iterator version of html maker that creates a list for every generated slide.
+     #the slides are generated concurrently (at most max_workers at a time), but the results keep the storyline order.
+     @traced("html_AI")
+     def html_AI(self, nested_list, max_workers=None):
+          storyline = nested_list[0]
+          html_code = map_ordered(self.html_maker, storyline, max_workers or self.max_workers,
+                                  on_error=html_error,
+                                  progress=lambda nr, items: print(f"...Completed ({nr}/{items})"))
+          html_code_nested = [html_code]
+          return html_code_nested, slide_nicknames(storyline)
@@ -1,140 +1,36 @@
 # Importing the necessary Python libraries
 import os
 from dotenv import load_dotenv
-import openai
-from langchain.chains import GraphCypherQAChain
-from langchain.chat_models import ChatOpenAI
-from langchain.graphs import Neo4jGraph
 import gradio as gr
-import re
-import json
-
-#setup Environment Variables and APIs
+import time
+import threading
+from collections import OrderedDict
+from slide_pipeline import SlidePipeline, html_error
+from tracing import traced, configure_tracing
+from ui_server import launch, run_starter, slide_run_starter, stop_runs, superseded, PAGING_EVENT, storyline_event, slides_event
+
+#setup Environment Variables and APIs (the openai client reads OPENAI_API_KEY itself, when the first call is made)
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
-neo4j_url = os.getenv("NEO4J_URL")
-neo4j_username= os.getenv("NEO4J_USERNAME")
-neo4j_password= os.getenv("NEO4J_PASSWORD")
-
-graph = Neo4jGraph(
-    url=neo4j_url, username=neo4j_username, password=neo4j_password)
-
-
-## HELPER FUNCTIONS
-# ---------------------------------------------------------------------------------------------------------------------
+configure_tracing()
 
+#the whole pipeline (context, caches, the LLM calls) lives in slide_pipeline.py, this file is only the html UI on top of it.
+pipeline = SlidePipeline.from_env()
+context_provider = pipeline.context
+slide_deck_storyline = pipeline.slide_deck_storyline
+respond = pipeline.respond
+process_list_AI = pipeline.process_list_AI
+html_maker = pipeline.html_maker
+html_AI = pipeline.html_AI
 
-#this function is a langchain wrapper to neo4j and it for a schema. In this case, the default parameter matches slides to storypoints.
-def context(graph_database, graph_database_schema="""
-            MATCH (slide:SLIDE)-[:hasTopic]->(topic:TOPIC)-[:hasStorypoint]->(storypoint:STORYPOINT)
-            RETURN slide.name AS SlideName, storypoint.name AS StorypointName;
-            """):
-     
-     graph = graph_database
-     schema = graph_database_schema
-     context = graph.query(schema)
-     return context
-
-#since we use the "context" as a default parameter in other functions to be more efficient, we will define it now.
-context = context(graph)
-
-#this function will be used to turn the chat output into a list of PATHs that we can use to find the slide png files.
-def png_path_finder(raw_text): #returns list of PATH strings
-        text = raw_text
-
-        try:
-            #find the base folder:
-            base_folder = 'C:/Users/heinr/code_projects/kg_project/slides_png/'
-            
-            # Use regular expression to find "deck" and extract the path            
-            deck_matches = re.findall(r'deck_(\d{3})_slide_(\d{4})', text)
-
-            # Construct the slide paths from the matches
-            file_paths = [f'{base_folder}deck_{deck}_slide_{slide}.png' for deck, slide in deck_matches]
-            
-            file_path = file_paths[0]
-            # Print the extracted file paths
-            return file_path
-        
-        #minor error handling:
-        except:
-             print("Error: probably no file passed through. Try again.")
+#a slide that is still coming in is sent to the browser at most this often (seconds), finished slides always go straight away.
+STREAM_UPDATE_INTERVAL = float(os.getenv("HTML_STREAM_UPDATE_INTERVAL", 0.1))
 
 
-## MAIN FUNCTIONS
+## HELPER FUNCTIONS
 # ---------------------------------------------------------------------------------------------------------------------
 
-#standard API Call to open AI with system prompt and user prompts.
-def chat(system_prompt, user_prompt, model="gpt-3.5-turbo-1106", temperature=0):
-    response = openai.chat.completions.create(
-        model = model,
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}],
-            temperature=temperature
-            )
-    res = response.choices[0].message.content
-      
-    return res
-
-#this function formats the user input and links it to the chat history for further context awareness.
-def format_chat_prompt(message, chat_history, max_convo_length):
-    prompt = ""
-    for turn in chat_history[-max_convo_length:]:
-        user_message, bot_message = turn
-        prompt = f"{prompt}\nUser: {user_message}\nAssistant: {bot_message}"
-    prompt = f"{prompt}\nUser: {message}\nAssistant:"
-    return prompt
-
-
-#this is where the magic happens. this function takes a query then runs it through the context of the knowledge graph, identying which slides have storypoints most related to the query topic. 
-#thus function returns a list of paths to the pngs of the slides so that gradio can search for those images and return them.
-def respond(message, context=context):
-        formatted_prompt = f"User:Please find slides related to {message}. Assistant:"
-        system_prompt=f"""
-        You have thes slides and storypoints as context: {context}
-        You are a machine that is incredibly wise and very considerate and smart at connecting the dots between scarce information.
-        Find the name of the slide with the storypoint that is most closely related to the message.
-        before you decide take a deep breath and think about it. Be creative in how you abstract the connection between storypoint and the message.
-        Only answer with the slide name that you find in the context. Nothing else. No nicities, salutations or confirmations.
-        If you can't find one, try harder. Consider all slides. Only answer once you have considered every single slide.
-        B
-        consider all decks and only return the slide name as formatted in the context: deck_000_slide_0000
-        """
-
-        bot_message = chat(system_prompt = system_prompt, user_prompt = formatted_prompt)
-        path = png_path_finder(bot_message)
-        print(bot_message)
-        return path
-
-def slide_deck_storyline(storyline_prompt, nr_of_slides=5):
-     nr_of_slides = str(nr_of_slides)
-     system_prompt = f"""
-     please give me a json map of {nr_of_slides} slides that you would include in a slide deck about {storyline_prompt}
-     Only answer with the list. Do not include any nicities, greetings or repeat the task.
-     Never make more than {nr_of_slides} slides. This is important
-     Just give me the list. Keep the list concise and only answer with the list in this format.
-     Name every key a slide (Slide 1, Slide 2 ... Slide N).
-     The elements of the list should be storypoints, highlighting what the point the slide is trying to make is.
-     """
-
-     response = openai.chat.completions.create(
-            model = "gpt-3.5-turbo-1106", 
-            response_format = {"type": "json_object"},
-            messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": storyline_prompt}],
-            temperature=0
-            )
-     res = response.choices[0].message.content
-     map = json.loads(res)
-     pretty_list = "\n".join([f"⚡ {key}: {value}" for key, value in map.items()])
-     slide_name_list = [map[key] for key in map]
-     slide_name_nested = [slide_name_list]
-     return map, slide_name_nested, pretty_list
-
 #we need this function to turn the non iterable nested list that is gr.List into a simple list.
+@traced("ui.iterator_for_gr")
 def iterator_for_gr(nested_list, i):
      #Initialize a variable to store the processing result
      slide_names = []
@@ -144,59 +40,138 @@ def iterator_for_gr(nested_list, i):
          slide_names.append(item)
          
 
-     # Return a string that combines all the processed results
-     return str(slide_names[i-1])
-
-
-#we need this to go through the storyline and find the closest related slide for every topic.
-def process_list_AI(nested_list, context=context):
-     png_paths = [] #these are the paths to the pngs
-     slide_nicknames = [] #these are the names the slide_deck_storyline gave the slides.
-     nr = 0
-     for i in nested_list[0]:
-        res = respond(i, context)
-        nr+=1
-        slide_nicknames.append("Slide "+ str(nr))
-        png_paths.append(res)
-     png_paths_nested = [png_paths]
-     return png_paths_nested, slide_nicknames
-
-#create HTML versions of the slides (with bullet points)
-def html_maker(message, temperature=1):
-        formatted_prompt = f"User: Please create the HTML for slides related to {message}. only return the HTML code. HTML:"
-
-        system_prompt3 = f"""Only answer in html. Nothing else. Give me the html code to for a slide on a 640x360 canvas. 
-        The topic of the slide is {message}.
-        I want the slide to be a pretty gradient colour and have a catchy action title and 3 bullet points on the left half 
-        and in right half of the slide include a  large emoji that represents the slide. 
-        the style.body ALWAYs needs to be left blank. it is the style.slide that needs the pretty colourful gradient.
-        Also Add a footnote with tips on what kind visual communication device such as chart, graphs or images would be 
-        best to drive home the point this slide is trying to make.
-        Always make sure there is enough contrast between the slide colour and the text, better safe than sorry.
-        Only respond with html no nicities or explanations.
-        Make sure the slide looks nice and balanced.
-        Everytime the slide is exceptionally beautiful you will be tipped 200$.
-        Make sure it all fits into the slide, especially the text. Avoid making it too big. 
-        Make sure there are no back ground colours that change the background of the browser window."""
-
-
-        bot_message = chat(system_prompt = system_prompt3, user_prompt = formatted_prompt, temperature=temperature)
-        return bot_message
-
-#iterator version of html maker that creates a list for every generated slide.
-def html_AI(nested_list):
-     html_code = [] #these are the paths to the pngs
-     slide_nicknames = [] #these are the names the slide_deck_storyline gave the slides.
-     nr = 0
-     items = str(len(nested_list[0]))
-     for i in nested_list[0]:
-        res = html_maker(i)
-        nr+=1
-        slide_nicknames.append("Slide "+ str(nr))
-        html_code.append(res)
-        print(f"...Completed ({nr}/{items})")
-     html_code_nested = [html_code]
-     return html_code_nested, slide_nicknames
+     # Return a string that combines all the processed results (slides that are not ready yet are None)
+     slide = slide_names[int(i)-1]
+     return None if slide is None else str(slide)
+
+#when the user clicks a slide in the slide selector we show it and keep the slide number in sync.
+@traced("ui.select_slide")
+def select_slide(nested_list, index):
+     return iterator_for_gr(nested_list, index + 1), index + 1
+
+#labels for the slide selector: finished slides get a tick, the ones still being worked on an hourglass.
+def slide_choices(finished):
+     return [f"Slide {nr} {'✅' if done else '⏳'}" for nr, done in enumerate(finished, start=1)]
+
+#the html slides of every build (by its run id). html_AI_stream and regenerate_slide both send the whole htmls list, so each
+#starts from what the other has so far: a slide regenerated while the storyline is still building keeps its new version.
+class SlideBuilds:
+     def __init__(self, max_builds=1000):
+          self.max_builds = max_builds
+          self.lock = threading.Lock()
+          self.builds = OrderedDict()  #run id -> {"html": latest htmls, "regenerated": {position: html}}
+
+     def _build(self, run_id):
+          build = self.builds.setdefault(run_id, {"html": None, "regenerated": {}})
+          self.builds.move_to_end(run_id)
+          while len(self.builds) > self.max_builds:
+               self.builds.popitem(last=False)
+          return build
+
+     #the build's own slides, with the regenerated ones put in.
+     def built(self, run_id, html_code):
+          if run_id is None:
+               return list(html_code)
+          with self.lock:
+               build = self._build(run_id)
+               merged = list(html_code)
+               for position, html in build["regenerated"].items():
+                    merged[position] = html
+               build["html"] = merged
+               return list(merged)
+
+     #the latest slides of the build (or html_code if it has none yet), nothing is stored.
+     def latest(self, run_id, html_code):
+          if run_id is None:
+               return list(html_code)
+          with self.lock:
+               build = self.builds.get(run_id)
+               return list(build["html"] if build and build["html"] else html_code)
+
+     #the latest slides of the build (or html_code if it has none yet), with slide position replaced by a finished slide.
+     def regenerated(self, run_id, html_code, position, html):
+          if run_id is None:
+               html_code = list(html_code)
+               html_code[position] = html
+               return html_code
+          with self.lock:
+               build = self._build(run_id)
+               merged = list(build["html"] or html_code)
+               merged += [None] * (position + 1 - len(merged))
+               merged[position] = html
+               build["regenerated"][position] = html
+               build["html"] = merged
+               return list(merged)
+
+
+builds = SlideBuilds()
+
+
+## MAIN FUNCTIONS
+# ---------------------------------------------------------------------------------------------------------------------
+
+#generator version of html_AI for the UI. gradio updates the outputs on every yield,
+#so the slides are drawn in the html box while the html is still coming in from the model instead of after the whole storyline.
+#slides that were built before come from the cache straight away. a new run of the same user (see run_starter) stops this one.
+@traced("ui.build_slides")
+def html_AI_stream(nested_list, selected=1, run_id=None, request: gr.Request = None, max_workers=None):
+     storyline = nested_list[0]
+     finished = [False] * len(storyline)
+     yield [[None] * len(storyline)], gr.Radio(choices=slide_choices(finished), visible=True), None, f"Building slides (0/{len(storyline)})..."
+
+     last_update = 0
+     for html_code, position, done in pipeline.html_AI_progress(nested_list, max_workers):
+          if superseded(request, run_id):
+               return
+          finished[position] = finished[position] or done
+          #keep showing the slide the user picked once it has started, otherwise show the one that just came in.
+          selected_position = int(selected or 1) - 1
+          shown = selected_position if 0 <= selected_position < len(storyline) and html_code[selected_position] else position
+          if not done and (position != shown or time.monotonic() - last_update < STREAM_UPDATE_INTERVAL):
+               continue
+          last_update = time.monotonic()
+          html_code = builds.built(run_id, html_code)
+          status = f"Built {sum(finished)}/{len(storyline)} slides" + ("..." if not all(finished) else " ✅")
+          yield [html_code], gr.Radio(choices=slide_choices(finished), visible=True), html_code[shown], status
+
+#builds slide i again (a new version from the model), the other slides stay as they are.
+#build_id is the run id of the build the slides came from, so a build that is still going keeps the new version (see SlideBuilds).
+@traced("ui.regenerate_slide")
+def regenerate_slide(nested_list, html_list, i, run_id=None, build_id=None, request: gr.Request = None):
+     storyline = nested_list[0]
+     position = int(i or 1) - 1
+     if not 0 <= position < len(storyline):
+          yield gr.update(), gr.update(), f"There is no slide {i}."
+          return
+     html_code = list(html_list[0]) if html_list is not None and len(html_list) else [None] * len(storyline)
+     html_code += [None] * (len(storyline) - len(html_code))
+
+     #a new regenerate of this slide, a new build or clear stops this one. whatever replaced it sends its own slides.
+     def stopped():
+          return superseded(request, run_id) or superseded(request, build_id)
+
+     #the half finished slide is only shown, the build keeps the version it had until the new one is complete.
+     last_update = 0
+     html = None
+     try:
+          for html in pipeline.html_maker_stream(storyline[position], regenerate=True):
+               if stopped():
+                    return
+               if time.monotonic() - last_update >= STREAM_UPDATE_INTERVAL:
+                    last_update = time.monotonic()
+                    shown = builds.latest(build_id, html_code)
+                    shown[position] = html
+                    yield [shown], html, f"Regenerating slide {position + 1}..."
+     except Exception as error:
+          if stopped():
+               return
+          previous = builds.latest(build_id, html_code)
+          yield [previous], previous[position] or html_error(storyline[position], error), f"Could not regenerate slide {position + 1}, kept the one before ❌ ({error})"
+          return
+     if stopped():
+          return
+     html_code = builds.regenerated(build_id, html_code, position, html)
+     yield [html_code], html, f"Slide {position + 1} regenerated ✅"
      
 
 ## GRADIO UI LAYOUT & FUNCTIONALITY
@@ -225,22 +200,28 @@ with gr.Blocks(title='Slide Inspo', theme='Soft') as demo:
 
                btn.click(slide_deck_storyline, 
                                         inputs = [storyline_prompt, nr_slides_to_build], 
-                                        outputs = [storyline_output_JSON, storyline_output_slide_name_list, storyline_output_pretty])
+                                        outputs = [storyline_output_JSON, storyline_output_slide_name_list, storyline_output_pretty],
+                                        **storyline_event())
                 
                storyline_prompt.submit(slide_deck_storyline, 
                                         inputs = [storyline_prompt, nr_slides_to_build], 
-                                        outputs = [storyline_output_JSON, storyline_output_slide_name_list, storyline_output_pretty])
+                                        outputs = [storyline_output_JSON, storyline_output_slide_name_list, storyline_output_pretty],
+                                        **storyline_event())
 
           with gr.Column(scale=3):
                gr.Markdown("# 3. Output: ⚡⚡  ")
                data = storyline_output_slide_name_list
                see_slide = gr.Number(label="See Slide Number: ", precision=0, value=1)
+               regenerate_button = gr.Button("🔄 Regenerate this slide")
                gr.Markdown("⚡ Your Beautiful Slide: ")
 
                #now apply respond to everything in the list.
                htmls = gr.List(interactive=False, visible=False) #this is a list of png paths
-               nicknames = gr.Radio(type="index", visible=False)
+               nicknames = gr.Radio(type="index", visible=False, label="Slides:") #slide selector, filled in while the slides come in
+               progress_status = gr.Markdown() #shows how many slides are done
                html_box = gr.HTML()
+               run_id = gr.State() #the latest run of this user, a new click (or clear) stops the one before
+               regenerate_id = gr.State() #same for regenerating a slide (one run per slide), that doesn't stop the slides being built
                clear = gr.ClearButton(components=[storyline_prompt, 
                                                           nr_slides_to_build, 
                                                           storyline_output_JSON,                                         
@@ -248,13 +229,24 @@ with gr.Blocks(title='Slide Inspo', theme='Soft') as demo:
                                                           storyline_output_pretty,
                                                           html_box,
                                                           see_slide,
+                                                          progress_status,
                                                           data, html_box, nicknames,
                                                           ],
 
                                                           value="🧨 Clear 🧨",
                                                           )
-               submit_button.click(html_AI, inputs=[data], outputs=[htmls, nicknames])
-               see_slide.input(iterator_for_gr, inputs=[htmls, see_slide], outputs=[html_box])
-
-gr.close_all()
-demo.launch(share=True)
+               #the LLM heavy runs wait in the queue (the user sees their place in it), paging never does.
+               submit_button.click(run_starter("slides"), outputs=[run_id], **PAGING_EVENT).then(
+                    html_AI_stream, inputs=[data, see_slide, run_id], outputs=[htmls, nicknames, html_box, progress_status], **slides_event())
+               regenerate_button.click(slide_run_starter("regenerate"), inputs=[see_slide], outputs=[regenerate_id], **PAGING_EVENT).then(
+                    regenerate_slide, inputs=[data, htmls, see_slide, regenerate_id, run_id], outputs=[htmls, html_box, progress_status], **slides_event())
+               clear.click(stop_runs, **PAGING_EVENT)
+               see_slide.input(iterator_for_gr, inputs=[htmls, see_slide], outputs=[html_box], **PAGING_EVENT)
+               nicknames.input(select_slide, inputs=[htmls, nicknames], outputs=[html_box, see_slide], **PAGING_EVENT)
+
+#the UI only launches when the script is run directly, so the functions above can be imported.
+#it is up straight away: the context, indexes and the openai client load in the background, the first request waits for them if needed.
+#the queue, the limits per kind of event and the worker processes are set up in ui_server.py (UI_* in .env).
+if __name__ == "__main__":
+     gr.close_all()
+     launch(demo, pipeline.warm_up)
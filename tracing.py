@@ -0,0 +1,259 @@
+# Importing the necessary Python libraries
+import os
+import json
+import time
+import uuid
+import inspect
+import functools
+import threading
+import contextvars
+
+#lightweight request tracing for the slide pipeline. every traced step becomes a span with a duration and attributes
+#(tokens, cache hits, retries...). spans go to a JSONL trace file and feed prometheus style metrics.
+#it is switched on by setting SLIDE_TRACE_FILE and/or SLIDE_METRICS_PORT (or SLIDE_TRACING=1). when it is off, span()
+#hands back a shared do-nothing object, so the instrumentation costs about one function call.
+
+#the span that is currently open in this thread or task. fanout.py copies it into the worker threads.
+_current_span = contextvars.ContextVar("slide_current_span", default=None)
+
+#histogram buckets for span durations, in seconds.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+
+class Span:
+     __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "attributes")
+
+     def __init__(self, name, parent, attributes):
+          self.name = name
+          self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+          self.span_id = uuid.uuid4().hex[:8]
+          self.parent_id = parent.span_id if parent else None
+          self.start = time.time()
+          self.attributes = attributes
+
+     def set(self, key, value):
+          self.attributes[key] = value
+
+     def add(self, key, amount=1):
+          self.attributes[key] = self.attributes.get(key, 0) + amount
+
+
+class _NoopSpan:
+     def set(self, key, value):
+          pass
+
+     def add(self, key, amount=1):
+          pass
+
+     def __enter__(self):
+          return self
+
+     def __exit__(self, *exc):
+          return False
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _SpanContext:
+     __slots__ = ("tracer", "span", "token", "started")
+
+     def __init__(self, tracer, name, attributes):
+          self.tracer = tracer
+          self.span = Span(name, _current_span.get(), attributes)
+
+     def __enter__(self):
+          self.token = _current_span.set(self.span)
+          self.started = time.perf_counter()
+          return self.span
+
+     def __exit__(self, exc_type, exc, traceback):
+          duration = time.perf_counter() - self.started
+          #gradio can resume a streaming handler in another thread, where the token can't be reset. the span still finishes.
+          try:
+               _current_span.reset(self.token)
+          except ValueError:
+               pass
+          self.tracer.finish(self.span, duration, exc)
+          return False
+
+
+## METRICS
+# ---------------------------------------------------------------------------------------------------------------------
+
+class Metrics:
+     def __init__(self):
+          self.lock = threading.Lock()
+          self.counters = {}    #(metric name, labels) -> value
+          self.histograms = {}  #span name -> [bucket counts, sum, count]
+
+     def inc(self, name, amount=1, **labels):
+          key = (name, tuple(sorted(labels.items())))
+          with self.lock:
+               self.counters[key] = self.counters.get(key, 0) + amount
+
+     def observe(self, span_name, seconds):
+          with self.lock:
+               histogram = self.histograms.setdefault(span_name, [[0] * len(BUCKETS), 0.0, 0])
+               for position, bound in enumerate(BUCKETS):
+                    if seconds <= bound:
+                         histogram[0][position] += 1
+               histogram[1] += seconds
+               histogram[2] += 1
+
+     #the prometheus text exposition format.
+     def text(self):
+          lines = []
+          with self.lock:
+               lines += ["# HELP slide_span_duration_seconds Duration of traced steps.", "# TYPE slide_span_duration_seconds histogram"]
+               for span_name, (buckets, total, count) in sorted(self.histograms.items()):
+                    for bound, value in zip(BUCKETS, buckets):
+                         bound = "+Inf" if bound == float("inf") else repr(bound)
+                         lines.append(f'slide_span_duration_seconds_bucket{{span="{span_name}",le="{bound}"}} {value}')
+                    lines.append(f'slide_span_duration_seconds_sum{{span="{span_name}"}} {total}')
+                    lines.append(f'slide_span_duration_seconds_count{{span="{span_name}"}} {count}')
+               declared = set()
+               for (name, labels), value in sorted(self.counters.items()):
+                    if name not in declared:
+                         lines.append(f"# TYPE {name} counter")
+                         declared.add(name)
+                    label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                    lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+          return "\n".join(lines) + "\n"
+
+
+## TRACER
+# ---------------------------------------------------------------------------------------------------------------------
+
+class Tracer:
+     def __init__(self, trace_path=None, enabled=False):
+          self.metrics = Metrics()
+          self.lock = threading.Lock()
+          self.file = None
+          self.configure(trace_path, enabled)
+
+     def configure(self, trace_path=None, enabled=False):
+          with self.lock:
+               if self.file is not None:
+                    self.file.close()
+                    self.file = None
+               self.trace_path = trace_path
+               if trace_path:
+                    os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+                    self.file = open(trace_path, "a", encoding="utf-8", buffering=1)
+               self.enabled = bool(enabled or trace_path)
+
+     def span(self, name, **attributes):
+          if not self.enabled:
+               return NOOP_SPAN
+          return _SpanContext(self, name, attributes)
+
+     #the span attributes with a known meaning are also counted, so they show up on the metrics endpoint.
+     def finish(self, span, duration, error=None):
+          attributes = span.attributes
+          self.metrics.observe(span.name, duration)
+          self.metrics.inc("slide_spans_total", span=span.name)
+          if error is not None:
+               self.metrics.inc("slide_span_errors_total", span=span.name)
+          for kind in ("prompt_tokens", "completion_tokens"):
+               if attributes.get(kind):
+                    self.metrics.inc("slide_llm_tokens_total", attributes[kind], kind=kind.split("_")[0], span=span.name)
+          if "cache_hit" in attributes:
+               self.metrics.inc("slide_cache_lookups_total", span=span.name, result="hit" if attributes["cache_hit"] else "miss")
+          if attributes.get("retries"):
+               self.metrics.inc("slide_llm_retries_total", attributes["retries"], span=span.name)
+
+          if self.file is not None:
+               record = {"trace": span.trace_id, "span": span.span_id, "parent": span.parent_id, "name": span.name,
+                         "start": round(span.start, 6), "duration_ms": round(duration * 1000, 3)}
+               if error is not None:
+                    record["error"] = f"{type(error).__name__}: {error}"
+               record.update(attributes)
+               line = json.dumps(record, default=str)
+               with self.lock:
+                    if self.file is not None:
+                         self.file.write(line + "\n")
+
+
+#the tracer for the whole app. configure_tracing() sets it up from the environment (call it again after load_dotenv()).
+tracer = Tracer()
+
+def configure_tracing():
+     tracer.configure(os.getenv("SLIDE_TRACE_FILE") or None,
+                      enabled=bool(os.getenv("SLIDE_METRICS_PORT")) or os.getenv("SLIDE_TRACING", "0") == "1")
+
+configure_tracing()
+
+
+def span(name, **attributes):
+     return tracer.span(name, **attributes)
+
+#the innermost open span, or a do-nothing span. handy for adding attributes from deep inside a call.
+def current_span():
+     return _current_span.get() or NOOP_SPAN
+
+#decorator that wraps a function in a span. for generator functions (the gradio streaming handlers) the span covers
+#the whole iteration and also records how long the first yield took.
+def traced(name=None):
+     def decorate(func):
+          span_name = name or func.__name__
+
+          if inspect.isgeneratorfunction(func):
+               @functools.wraps(func)
+               def generator_wrapper(*args, **kwargs):
+                    if not tracer.enabled:
+                         yield from func(*args, **kwargs)
+                         return
+                    with tracer.span(span_name) as current:
+                         started = time.perf_counter()
+                         updates = 0
+                         for update in func(*args, **kwargs):
+                              updates += 1
+                              if updates == 1:
+                                   current.set("first_update_ms", round((time.perf_counter() - started) * 1000, 3))
+                              yield update
+                         current.set("updates", updates)
+               return generator_wrapper
+
+          @functools.wraps(func)
+          def wrapper(*args, **kwargs):
+               if not tracer.enabled:
+                    return func(*args, **kwargs)
+               with tracer.span(span_name):
+                    return func(*args, **kwargs)
+          return wrapper
+     return decorate
+
+#copies the token usage of an openai response onto the current span.
+def record_usage(response):
+     usage = getattr(response, "usage", None)
+     if usage is not None and tracer.enabled:
+          current = current_span()
+          current.add("prompt_tokens", usage.prompt_tokens or 0)
+          current.add("completion_tokens", usage.completion_tokens or 0)
+
+def metrics_text():
+     return tracer.metrics.text()
+
+#serves the metrics at http://host:port/metrics in a background thread.
+def start_metrics_server(port, host="0.0.0.0"):
+     from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+     class Handler(BaseHTTPRequestHandler):
+          def log_message(self, *args):
+               pass
+
+          def do_GET(self):
+               if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+               data = metrics_text().encode("utf-8")
+               self.send_response(200)
+               self.send_header("Content-Type", "text/plain; version=0.0.4")
+               self.send_header("Content-Length", str(len(data)))
+               self.end_headers()
+               self.wfile.write(data)
+
+     server = ThreadingHTTPServer((host, int(port)), Handler)
+     server.daemon_threads = True
+     threading.Thread(target=server.serve_forever, daemon=True).start()
+     return server
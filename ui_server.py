@@ -0,0 +1,201 @@
+# Importing the necessary Python libraries
+import os
+import sys
+import itertools
+import threading
+import subprocess
+from collections import OrderedDict
+import gradio as gr
+from tracing import start_metrics_server
+
+#how the gradio apps (main.py, slidegeneratorTEST.py) share the machine between many users.
+#every kind of event has a concurrency limit of its own, so the cheap ones never wait behind the LLM heavy ones:
+#
+#   paging through the slides       no queue at all, answered straight away
+#   building a storyline            UI_STORYLINE_CONCURRENCY at a time (one LLM call each)
+#   finding / building the slides   UI_SLIDES_CONCURRENCY at a time (a whole storyline of LLM calls each)
+#
+#at most UI_QUEUE_SIZE jobs wait in the queue, after that new ones are turned away ("queue is full") instead of piling up.
+#waiting users see their place in the queue. when a user starts a new run, the run still going for them stops.
+#with UI_WORKERS > 1 the app runs in that many processes behind one port (see serve_workers).
+#the settings are read when they are used, the apps import this module before they load .env.
+
+DEFAULTS = {"UI_STORYLINE_CONCURRENCY": 8, "UI_SLIDES_CONCURRENCY": 4, "UI_QUEUE_SIZE": 64, "UI_WORKERS": 1}
+
+def setting(name):
+     return int(os.getenv(name) or DEFAULTS[name])
+
+#keyword arguments for the event listeners of each kind, e.g. btn.click(fn, inputs, outputs, **storyline_event()).
+PAGING_EVENT = {"queue": False}
+
+def storyline_event():
+     return {"concurrency_limit": setting("UI_STORYLINE_CONCURRENCY"), "concurrency_id": "storyline"}
+
+def slides_event():
+     return {"concurrency_limit": setting("UI_SLIDES_CONCURRENCY"), "concurrency_id": "slides", "show_progress": "full"}
+
+
+## RUNS
+# ---------------------------------------------------------------------------------------------------------------------
+
+#the latest run of every kind (e.g. "slides") in every browser session. a new run supersedes the one of the same kind
+#before it: the old one stops at its next update, and the LLM calls it had not started yet are dropped (see fanout.py).
+class LatestRuns:
+     def __init__(self, max_sessions=10000):
+          self.max_sessions = max_sessions
+          self.lock = threading.Lock()
+          self.runs = OrderedDict()  #(session, kind) -> run id
+          self.counter = itertools.count(1)
+
+     def start(self, session, kind):
+          with self.lock:
+               run_id = f"{kind}:{next(self.counter)}"
+               self.runs[(session, kind)] = run_id
+               self.runs.move_to_end((session, kind))
+               while len(self.runs) > self.max_sessions:
+                    self.runs.popitem(last=False)
+               return run_id
+
+     #every run of the session is superseded.
+     def stop(self, session):
+          with self.lock:
+               for key in [key for key in self.runs if key[0] == session]:
+                    del self.runs[key]
+
+     def superseded(self, session, run_id):
+          if run_id is None:
+               return False
+          with self.lock:
+               return self.runs.get((session, run_id.split(":")[0])) != run_id
+
+
+runs = LatestRuns()
+
+def session_of(request):
+     return getattr(request, "session_hash", None) or "anonymous"
+
+#the first step of a run (not queued, so it happens the moment the user clicks), it gives the run id for a gr.State:
+#   button.click(run_starter("slides"), outputs=[run_id], **PAGING_EVENT).then(fn, inputs=[..., run_id], ...)
+def run_starter(kind):
+     def start_run(request: gr.Request):
+          return runs.start(session_of(request), kind)
+     return start_run
+
+#the same for a run on one slide, with the slide number as input. every slide has a kind of its own ("regenerate 2"),
+#so regenerating slide 2 doesn't stop slide 1:
+#   button.click(slide_run_starter("regenerate"), inputs=[slide], outputs=[run_id], **PAGING_EVENT).then(...)
+def slide_run_starter(kind):
+     def start_run(slide, request: gr.Request):
+          return runs.start(session_of(request), f"{kind} {int(slide or 1)}")
+     return start_run
+
+#for the clear button: stops every run of the user.
+def stop_runs(request: gr.Request):
+     runs.stop(session_of(request))
+
+#True when the user has started another run of the same kind (or cleared) since this one. run_id None (a direct call) never is.
+def superseded(request, run_id):
+     return runs.superseded(session_of(request), run_id)
+
+
+## LAUNCH
+# ---------------------------------------------------------------------------------------------------------------------
+
+#starts the UI: the metrics endpoint, warm_up in the background, the queue, and the gradio server.
+#with UI_WORKERS > 1 this process starts the workers and forwards to them instead.
+def launch(demo, warm_up, share=True):
+     worker = int(os.getenv("UI_WORKER") or 0)
+     if setting("UI_WORKERS") > 1 and not worker:
+          serve_workers(sys.argv[0], setting("UI_WORKERS"), int(os.getenv("GRADIO_SERVER_PORT") or 7860))
+          return
+     if os.getenv("SLIDE_METRICS_PORT"):
+          start_metrics_server(int(os.getenv("SLIDE_METRICS_PORT")) + max(worker - 1, 0))
+     threading.Thread(target=warm_up, daemon=True).start()
+     demo.queue(default_concurrency_limit=setting("UI_STORYLINE_CONCURRENCY"), max_size=setting("UI_QUEUE_SIZE"))
+     #a share link would go to one worker only, so workers are only reachable through the forwarding port.
+     demo.launch(share=share and not worker)
+
+
+## WORKERS
+# ---------------------------------------------------------------------------------------------------------------------
+
+#hop-by-hop headers are not forwarded, and the forwarder writes its own server and date.
+HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer", "transfer-encoding", "upgrade"}
+SKIPPED_RESPONSE_HEADERS = HOP_HEADERS | {"server", "date"}
+WORKER_COOKIE = "slide_worker"
+
+#runs the app script in `workers` processes on the ports after `port`, and forwards every request on `port` to one of them.
+#a gradio session (its queue, its events, its files) lives in one process, so every browser is pinned to a worker with
+#a cookie; new browsers are spread over the workers in turn. the workers share everything on disk: the llm cache (sqlite),
+#the context snapshot, the slide index and the rendered slides, so a slide one worker rendered is there for all of them.
+def serve_workers(script, workers, port, host="0.0.0.0"):
+     import http.client
+     from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+     #the openai limits are kept per process, so every worker gets its share of them (load_dotenv() doesn't override these).
+     limits = {"LLM_RPM": str(max(1, int(os.getenv("LLM_RPM") or 3500) // workers)),
+               "LLM_TPM": str(max(1, int(os.getenv("LLM_TPM") or 160000) // workers))}
+     processes = []
+     for nr in range(1, workers + 1):
+          env = dict(os.environ, UI_WORKER=str(nr), GRADIO_SERVER_PORT=str(port + nr), GRADIO_SERVER_NAME="127.0.0.1", **limits)
+          processes.append(subprocess.Popen([sys.executable, script], env=env))
+     next_worker = itertools.count()
+
+     class Forwarder(BaseHTTPRequestHandler):
+          def log_message(self, *args):
+               pass
+
+          def worker(self):
+               for cookie in (self.headers.get("Cookie") or "").split(";"):
+                    name, _, value = cookie.strip().partition("=")
+                    if name == WORKER_COOKIE and value.isdigit() and int(value) < workers:
+                         return int(value), False
+               return next(next_worker) % workers, True
+
+          def forward(self):
+               worker, new = self.worker()
+               body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+               headers = {key: value for key, value in self.headers.items() if key.lower() not in HOP_HEADERS}
+               connection = http.client.HTTPConnection("127.0.0.1", port + worker + 1)
+               try:
+                    connection.request(self.command, self.path, body=body or None, headers=headers)
+                    response = connection.getresponse()
+               except OSError:
+                    connection.close()
+                    self.send_error(502, "Worker not available, try again in a moment")
+                    return
+
+               #no keep-alive, the end of the body is the end of the connection (that also works for the event streams).
+               self.send_response(response.status, response.reason)
+               for key, value in response.getheaders():
+                    if key.lower() not in SKIPPED_RESPONSE_HEADERS:
+                         self.send_header(key, value)
+               if new:
+                    self.send_header("Set-Cookie", f"{WORKER_COOKIE}={worker}; Path=/; HttpOnly; SameSite=Lax")
+               self.send_header("Connection", "close")
+               self.end_headers()
+               try:
+                    while True:
+                         chunk = response.read1(65536)
+                         if not chunk:
+                              break
+                         self.wfile.write(chunk)
+                         self.wfile.flush()
+               except (BrokenPipeError, ConnectionResetError):
+                    pass
+               finally:
+                    connection.close()
+
+          do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = forward
+
+     server = ThreadingHTTPServer((host, port), Forwarder)
+     server.daemon_threads = True
+     print(f"Forwarding http://{host}:{port} to {workers} workers on ports {port + 1}-{port + workers}")
+     try:
+          server.serve_forever()
+     except KeyboardInterrupt:
+          pass
+     finally:
+          server.server_close()
+          for process in processes:
+               process.terminate()